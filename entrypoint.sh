@@ -8,4 +8,4 @@ poetry run poe db-push
 
 # Run the commands in parallel
 echo "Starting the tailwind build and the main application in the background..."
-parallel --ungroup ::: "poetry run poe dev-tailwind" "poetry run uvicorn app.app:app --host 0.0.0.0 --reload"
\ No newline at end of file
+parallel --ungroup ::: "poetry run poe dev-tailwind" "poetry run uvicorn --factory app.app:create_app --host 0.0.0.0 --reload"
\ No newline at end of file
@@ -0,0 +1,137 @@
+"""
+Benchmark the NDJSON chat import and export.
+
+Generates a deterministic export of CHATS chats with MESSAGES messages each,
+imports it for a new user, exports it back and reports the throughput and the
+peak memory of the process. The benchmark runs against the database configured
+in the environment, or a temporary SQLite database with the default backend,
+and deletes its user afterwards.
+
+Usage:
+    poetry run python scripts/benchmark_import_export.py --chats 1000 --messages 100
+"""
+
+import argparse
+import asyncio
+import json
+import resource
+import secrets
+import tempfile
+import time
+import uuid
+from typing import AsyncIterator
+
+from sqlalchemy import delete
+
+from app import schemas
+from app.db import async_session, dispose_engine, init_models, models
+from app.service import AppService
+from app.settings import settings
+
+
+def make_export(chats: int, messages: int) -> bytes:
+    """
+    Build an NDJSON export with the given number of chats and messages.
+
+    Args:
+        chats (int): The number of chats.
+        messages (int): The number of messages per chat.
+
+    Returns:
+        bytes: The export.
+    """
+    lines = []
+    for chat_id in range(chats):
+        lines.append(
+            json.dumps({"type": "chat", "id": chat_id, "name": f"Chat {chat_id}"})
+        )
+        for index in range(messages):
+            content = f"Message {index}. " + "Lorem ipsum. " * (index % 20)
+            lines.append(
+                json.dumps(
+                    {
+                        "type": "message",
+                        "chat_id": chat_id,
+                        "kind": "human" if index % 2 == 0 else "assistant",
+                        "content": content,
+                        "create_date": "2024-01-01T00:00:00",
+                    }
+                )
+            )
+    return "\n".join(lines).encode()
+
+
+async def chunks(data: bytes, size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    """
+    Split the export into chunks, like a request body.
+    """
+    for start in range(0, len(data), size):
+        yield data[start : start + size]
+
+
+async def run(chats: int, messages: int, batch_size: int) -> None:
+    """
+    Run the benchmark and print the results.
+
+    Args:
+        chats (int): The number of chats.
+        messages (int): The number of messages per chat.
+        batch_size (int): The rows per INSERT batch of the import.
+    """
+    data = make_export(chats, messages)
+    await init_models()
+
+    async with async_session() as session:
+        app_service = AppService(session)
+        user = await app_service.create_user(
+            schemas.Signup(
+                username=f"benchmark-{uuid.uuid4().hex}",
+                password=secrets.token_urlsafe(),
+            )
+        )
+
+        try:
+            start = time.perf_counter()
+            result = await app_service.import_chats(user, chunks(data), batch_size)
+            elapsed = time.perf_counter() - start
+            print(
+                f"import: {result.chats} chats, {result.messages} messages "
+                f"in {elapsed:.2f}s ({result.messages / elapsed:,.0f} messages/s)"
+            )
+
+            start = time.perf_counter()
+            lines = 0
+            async for _ in app_service.export_chats(user):
+                lines += 1
+            elapsed = time.perf_counter() - start
+            print(
+                f"export: {lines} lines in {elapsed:.2f}s "
+                f"({lines / elapsed:,.0f} lines/s)"
+            )
+        finally:
+            async with session.begin():
+                await session.execute(
+                    delete(models.User).where(models.User.id == user.id)
+                )
+
+    await dispose_engine()
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"peak memory: {max_rss / 1024:,.0f} MiB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chats", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        if settings.database.backend == "sqlite":
+            settings.database.path = f"{directory}/benchmark.db"
+        asyncio.run(run(args.chats, args.messages, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Benchmark the event loop lag of the server under large-paste load.
+
+Starts the application with uvicorn on a temporary SQLite database, with the
+loop lag monitor enabled. CLIENTS concurrent clients each post PASTES unique
+log pastes of SIZE bytes to add-message and reload the chat page after each
+post, while a probe thread requests /metrics every 10ms. Reports the load time,
+the probe latency and the stalls reported by the server's lag monitor during
+the load. Run it on two checkouts to compare them.
+
+The probe latency also includes GIL contention with the load generator, which
+runs in this process.
+
+Usage:
+    poetry run python scripts/benchmark_render_lag.py --clients 4 --pastes 3 --size 200000
+"""
+
+import argparse
+import asyncio
+import os
+import secrets
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import httpx
+
+from app.db import dispose_engine, init_models
+from app.settings import settings
+
+ROOT = Path(__file__).parent.parent
+
+# Stalls longer than this are counted by the server's lag monitor.
+LAG_THRESHOLD = 0.1
+
+
+def make_paste(name: str, size: int) -> str:
+    """
+    Build a deterministic log paste, as users paste into the chat.
+
+    Args:
+        name (str): A name making the paste unique, so it is not cached.
+        size (int): The approximate size of the paste in characters.
+
+    Returns:
+        str: The paste.
+    """
+    lines = [f"Why does {name} fail?", "```"]
+    length = 0
+    index = 0
+    while length < size:
+        line = (
+            f"2024-01-01T12:{index // 60 % 60:02d}:{index % 60:02d} INFO "
+            f"worker-{index % 8} GET /api/items/{index}?page={index % 7} "
+            f"status=200 took {index * 7 % 1000}ms user_agent=*client_{index % 5}*"
+        )
+        lines.append(line)
+        length += len(line) + 1
+        index += 1
+    lines.append("```")
+    return "\n".join(lines)
+
+
+def free_port() -> int:
+    """
+    Get a free local TCP port.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return int(sock.getsockname()[1])
+
+
+def start_server(database: str, port: int) -> subprocess.Popen:
+    """
+    Start the application in a uvicorn process and wait until it serves requests.
+
+    Args:
+        database (str): The path of the SQLite database.
+        port (int): The port to listen on.
+
+    Returns:
+        subprocess.Popen: The server process.
+    """
+    env = {
+        **os.environ,
+        "DB_BACKEND": "sqlite",
+        "DB_PATH": database,
+        "LOOP_LAG_THRESHOLD": str(LAG_THRESHOLD),
+        "LLM_WARMUP_CONNECTIONS": "0",
+    }
+    server = subprocess.Popen(  # nosec B603
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "--factory",
+            "app.app:create_app",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        cwd=ROOT,
+        env=env,
+    )
+
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/login").raise_for_status()
+            return server
+        except httpx.HTTPError:
+            time.sleep(0.2)
+
+    server.terminate()
+    raise RuntimeError("The server did not start")
+
+
+def probe(base_url: str, latencies: list[float], done: threading.Event) -> None:
+    """
+    Request a cheap endpoint every 10ms and record how long each request took.
+    """
+    with httpx.Client(base_url=base_url) as client:
+        while not done.is_set():
+            start = time.perf_counter()
+            client.get("/metrics")
+            latencies.append(time.perf_counter() - start)
+            time.sleep(0.01)
+
+
+async def run(base_url: str, clients: int, pastes: int, size: int) -> None:
+    """
+    Run the benchmark against a started server and print the results.
+
+    Args:
+        base_url (str): The URL of the server.
+        clients (int): The number of concurrent clients.
+        pastes (int): The number of pastes posted by each client.
+        size (int): The size of each paste in characters.
+    """
+    async with httpx.AsyncClient(base_url=base_url, timeout=300) as client:
+        credentials = {"username": "benchmark", "password": secrets.token_urlsafe()}
+        await client.post("/auth/signup", json=credentials)
+        await client.post("/auth/login", json=credentials)
+
+        chat_urls = []
+        for index in range(clients):
+            response = await client.post("/chat/", json={"message": f"Chat {index}"})
+            chat_urls.append(response.headers["HX-Redirect"])
+
+        async def paste(chat_url: str) -> None:
+            for index in range(pastes):
+                message = make_paste(f"{chat_url} paste {index}", size)
+                response = await client.post(
+                    f"{chat_url}/add-message", json={"message": message}
+                )
+                response.raise_for_status()
+                (await client.get(chat_url)).raise_for_status()
+
+        before = (await client.get("/metrics")).json()["counters"]
+
+        latencies: list[float] = []
+        done = threading.Event()
+        prober = threading.Thread(target=probe, args=(base_url, latencies, done))
+        prober.start()
+
+        start = time.perf_counter()
+        try:
+            await asyncio.gather(*(paste(chat_url) for chat_url in chat_urls))
+        finally:
+            elapsed = time.perf_counter() - start
+            done.set()
+            prober.join()
+
+        after = (await client.get("/metrics")).json()["counters"]
+
+    blocks = after.get("event_loop_blocked_total", 0) - before.get(
+        "event_loop_blocked_total", 0
+    )
+    offloaded = after.get("markdown_offloaded_total", 0) - before.get(
+        "markdown_offloaded_total", 0
+    )
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"load: {clients * pastes} pastes of {size:,} characters in {elapsed:.1f}s")
+    print(
+        f"probe: {len(latencies)} requests, "
+        f"p50 {statistics.median(latencies) * 1000:.0f}ms, "
+        f"p99 {p99 * 1000:.0f}ms, max {latencies[-1] * 1000:.0f}ms"
+    )
+    print(f"blocks: {blocks:.0f} stalls over {LAG_THRESHOLD * 1000:.0f}ms")
+    print(f"offloaded renders: {offloaded:.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--pastes", type=int, default=3)
+    parser.add_argument("--size", type=int, default=200_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        settings.database.backend = "sqlite"
+        settings.database.path = f"{directory}/benchmark.db"
+        asyncio.run(init_models())
+        asyncio.run(dispose_engine())
+
+        port = free_port()
+        server = start_server(settings.database.path, port)
+        try:
+            asyncio.run(
+                run(f"http://127.0.0.1:{port}", args.clients, args.pastes, args.size)
+            )
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
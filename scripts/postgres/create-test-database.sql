@@ -0,0 +1,3 @@
+-- Run by the postgres image when it initializes an empty data directory.
+-- The test suite wipes this database, see TEST_DB_NAME in tests/conftest.py.
+CREATE DATABASE app_test;
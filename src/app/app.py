@@ -1,6 +1,11 @@
-from typing import Any
+import asyncio
+import logging
+from contextlib import asynccontextmanager, suppress
+from datetime import timedelta
+from typing import Any, AsyncGenerator
 
 from fastapi import (
+    APIRouter,
     FastAPI,
     Request,
 )
@@ -9,33 +14,167 @@ from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.security import HTTPBearer
 from fastapi.staticfiles import StaticFiles
 
+from app import llm
 from app.auth_router import auth_router
 from app.chat_router import chat_router
+from app.db import async_session, dispose_engine, get_engine
 from app.example_router import example_router
-from app.utils import templates
+from app.metrics import metrics
+from app.middleware import ProfilingMiddleware, QueryStatsMiddleware
+from app.monitoring import LoopLagMonitor
+from app.rendering import renderer
+from app.service import AppService
+from app.settings import settings
+from app.utils import get_templates
+
+logger = logging.getLogger(__name__)
 
 security = HTTPBearer()
 
+root_router = APIRouter()
 
-app = FastAPI()
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins="*",
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+async def purge_deleted_chats() -> None:
+    """
+    Periodically purges soft-deleted chats in the background.
+    """
+    while True:
+        await asyncio.sleep(settings.chats.purge_interval)
+        try:
+            async with async_session() as session:
+                await AppService(session).purge_deleted_chats(
+                    settings.chats.purge_batch_size
+                )
+        except Exception:
+            logger.exception("Purging deleted chats failed")
+
+
+async def archive_inactive_chats(after_days: float) -> None:
+    """
+    Periodically moves the messages of inactive chats to compressed archives in
+    the background.
+
+    Parameters:
+        - after_days: How many days a chat must be inactive to be archived.
+    """
+    while True:
+        await asyncio.sleep(settings.archive.interval)
+        try:
+            async with async_session() as session:
+                await AppService(session).archive_inactive_chats(
+                    timedelta(days=after_days),
+                    codec=settings.archive.codec,
+                    dictionary_size=settings.archive.dictionary_size,
+                    batch_size=settings.archive.batch_size,
+                )
+        except Exception:
+            logger.exception("Archiving inactive chats failed")
+
+
+async def preload_litellm() -> None:
+    """
+    Imports litellm in the background, so that startup does not wait for it.
+    """
+    try:
+        await llm.load_litellm()
+    except Exception:
+        logger.exception("Loading litellm failed")
+
+
+async def warm_up_llm() -> None:
+    """
+    Opens connections to the LLM provider in the background, so that a slow or
+    unreachable provider does not delay startup.
+    """
+    try:
+        await llm.warm_up()
+    except Exception:
+        logger.exception("Warming up LLM connections failed")
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncGenerator[None, None]:
+    """
+    Initializes the heavy application resources on startup and releases them on
+    shutdown, so that importing the application stays cheap.
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+    Parameters:
+        - _: The application.
+    """
+    get_engine()
+    get_templates()
+    preload_task = asyncio.create_task(preload_litellm())
+    warm_up_task = asyncio.create_task(warm_up_llm())
+    renderer.start()
+
+    purge_task = None
+    if settings.chats.soft_delete:
+        purge_task = asyncio.create_task(purge_deleted_chats())
+
+    archive_task = None
+    if settings.archive.after_days is not None:
+        archive_task = asyncio.create_task(
+            archive_inactive_chats(settings.archive.after_days)
+        )
+
+    lag_monitor = None
+    if settings.debug.loop_lag_threshold is not None:
+        lag_monitor = LoopLagMonitor(
+            threshold=settings.debug.loop_lag_threshold,
+            interval=settings.debug.loop_lag_interval,
+        )
+        lag_monitor.start()
+
+    yield
+
+    if lag_monitor is not None:
+        await lag_monitor.stop()
+    for task in (preload_task, warm_up_task, purge_task, archive_task):
+        if task is not None:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+    renderer.close(wait=True)
+    await llm.close()
+    await dispose_engine()
+
+
+def create_app() -> FastAPI:
+    """
+    Creates and configures the application.
+
+    Returns:
+        - FastAPI: The application.
+    """
+    app = FastAPI(lifespan=lifespan)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins="*",
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    if settings.debug.query_stats:
+        app.add_middleware(QueryStatsMiddleware)
+
+    if settings.debug.profile_token or settings.debug.profile_sample_rate:
+        app.add_middleware(ProfilingMiddleware)
 
+    app.mount("/static", StaticFiles(directory="static"), name="static")
 
-app.include_router(auth_router, prefix="/auth")
-app.include_router(chat_router, prefix="/chat")
-app.include_router(example_router, prefix="/example")
+    app.include_router(root_router)
+    app.include_router(auth_router, prefix="/auth")
+    app.include_router(chat_router, prefix="/chat")
+    app.include_router(example_router, prefix="/example")
 
+    app.add_exception_handler(401, custom_404_handler)
 
-@app.get("/")
+    return app
+
+
+@root_router.get("/")
 def home() -> RedirectResponse:
     """
     Redirects the user to the '/chat' endpoint.
@@ -43,7 +182,18 @@ def home() -> RedirectResponse:
     return RedirectResponse("/chat")
 
 
-@app.get("/login", response_class=HTMLResponse)
+@root_router.get("/metrics")
+def get_metrics() -> dict[str, Any]:
+    """
+    Returns a snapshot of the in-process metrics.
+
+    Returns:
+        - dict[str, Any]: The counters, gauges and summaries.
+    """
+    return metrics.snapshot()
+
+
+@root_router.get("/login", response_class=HTMLResponse)
 def login(
     request: Request,
 ) -> HTMLResponse:
@@ -56,7 +206,7 @@ def login(
     Returns:
         - HTMLResponse: The rendered login page.
     """
-    res: HTMLResponse = templates.TemplateResponse(
+    res: HTMLResponse = get_templates().TemplateResponse(
         request=request,
         name="login.html",
     )
@@ -64,7 +214,7 @@ def login(
     return res
 
 
-@app.get("/signup", response_class=HTMLResponse)
+@root_router.get("/signup", response_class=HTMLResponse)
 def signup(
     request: Request,
 ) -> HTMLResponse:
@@ -77,14 +227,13 @@ def signup(
     Returns:
         - HTMLResponse: The rendered signup page.
     """
-    res: HTMLResponse = templates.TemplateResponse(
+    res: HTMLResponse = get_templates().TemplateResponse(
         request=request,
         name="signup.html",
     )
     return res
 
 
-@app.exception_handler(401)
 async def custom_404_handler(_: Any, __: Any) -> RedirectResponse:
     """
     Handles the 401 exception and redirects the user to the '/login' endpoint.
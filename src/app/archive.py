@@ -0,0 +1,128 @@
+import json
+import zlib
+from datetime import datetime
+
+from app.db import models
+
+# Dictionaries never change once stored, so they are kept in memory by ID.
+dictionaries: dict[int, bytes] = {}
+
+
+def train_dictionary(codec: str, samples: list[bytes], size: int) -> bytes:
+    """
+    Build a compression dictionary from sample messages.
+
+    zstd trains a proper dictionary when there are enough samples. Otherwise,
+    and always for zlib which has no trainer, the dictionary is made of the
+    samples themselves, the most recent last as matches near the end of the
+    dictionary are the cheapest.
+
+    Args:
+        codec (str): The codec, "zlib" or "zstd".
+        samples (list[bytes]): The sample messages, oldest first.
+        size (int): The maximum size of the dictionary in bytes.
+
+    Returns:
+        bytes: The dictionary.
+    """
+    if codec == "zstd":
+        import zstandard
+
+        try:
+            return zstandard.train_dictionary(size, samples).as_bytes()
+        except zstandard.ZstdError:
+            return b"\n".join(samples)[-size:]
+
+    return b"\n".join(samples)[-min(size, 32768) :]
+
+
+def compress(codec: str, data: bytes, dictionary: bytes | None) -> bytes:
+    """
+    Compress data with a codec and an optional dictionary.
+
+    Args:
+        codec (str): The codec, "zlib" or "zstd".
+        data (bytes): The data to compress.
+        dictionary (bytes | None): The shared dictionary.
+
+    Returns:
+        bytes: The compressed data.
+    """
+    if codec == "zstd":
+        import zstandard
+
+        dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        return zstandard.ZstdCompressor(level=19, dict_data=dict_data).compress(data)
+
+    compressor = (
+        zlib.compressobj(9, zdict=dictionary) if dictionary else zlib.compressobj(9)
+    )
+    return compressor.compress(data) + compressor.flush()
+
+
+def decompress(codec: str, data: bytes, dictionary: bytes | None) -> bytes:
+    """
+    Decompress data compressed by `compress`.
+
+    Args:
+        codec (str): The codec, "zlib" or "zstd".
+        data (bytes): The compressed data.
+        dictionary (bytes | None): The shared dictionary used for compression.
+
+    Returns:
+        bytes: The decompressed data.
+    """
+    if codec == "zstd":
+        import zstandard
+
+        dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        return zstandard.ZstdDecompressor(dict_data=dict_data).decompress(data)
+
+    decompressor = (
+        zlib.decompressobj(zdict=dictionary) if dictionary else zlib.decompressobj()
+    )
+    return decompressor.decompress(data) + decompressor.flush()
+
+
+def pack_messages(messages: list[models.ChatMessage]) -> bytes:
+    """
+    Serialize messages for archival.
+
+    Args:
+        messages (list[models.ChatMessage]): The messages, oldest first.
+
+    Returns:
+        bytes: The serialized messages.
+    """
+    return json.dumps(
+        [
+            [message.id, message.kind, message.content, message.create_date.isoformat()]
+            for message in messages
+        ],
+        separators=(",", ":"),
+    ).encode()
+
+
+def unpack_messages(data: bytes, chat_id: int) -> list[models.ChatMessage]:
+    """
+    Deserialize archived messages.
+
+    The messages are transient and must not be added to a session.
+
+    Args:
+        data (bytes): The serialized messages.
+        chat_id (int): The ID of the chat the messages belong to.
+
+    Returns:
+        list[models.ChatMessage]: The messages, oldest first.
+    """
+    return [
+        models.ChatMessage(
+            id=id,
+            chat_id=chat_id,
+            kind=kind,
+            content=content,
+            create_date=datetime.fromisoformat(create_date),
+        )
+        for id, kind, content, create_date in json.loads(data)
+    ]
@@ -0,0 +1,245 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator
+
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.db import models
+from app.metrics import metrics
+from app.settings import settings
+
+
+def get_cache_size() -> int:
+    """
+    Get the maximum number of cached chats from the settings.
+
+    The cache is only coherent when a single process serves the database, which
+    is how SQLite is deployed, so by default it is disabled with PostgreSQL.
+
+    Returns:
+        int: The maximum number of cached chats, 0 when caching is disabled.
+    """
+    if settings.chats.cache_size is not None:
+        return settings.chats.cache_size
+    return 1024 if settings.database.backend == "sqlite" else 0
+
+
+def prompt_message(message: models.ChatMessage) -> dict:
+    """
+    Convert a chat message to the OpenAI message format.
+
+    Args:
+        message (models.ChatMessage): The message.
+
+    Returns:
+        dict: The message in OpenAI format.
+    """
+    role = "user" if message.kind == "human" else "assistant"
+    return {"role": role, "content": message.content}
+
+
+@dataclass
+class CachedChat:
+    """
+    A detached chat with its messages and the prompt built from them.
+    """
+
+    chat: models.Chat
+    prompt: list[dict]
+    size: int
+
+    @classmethod
+    def build(cls, chat: models.Chat) -> "CachedChat":
+        """
+        Build a cache entry from a chat loaded with its messages.
+
+        Args:
+            chat (models.Chat): The chat.
+
+        Returns:
+            CachedChat: The cache entry.
+        """
+        return cls(
+            chat=chat,
+            prompt=[prompt_message(message) for message in chat.messages],
+            size=sum(len(message.content) for message in chat.messages),
+        )
+
+
+@dataclass
+class ChatCache:
+    """
+    Bounded, write-through LRU cache of recently active chats.
+
+    Chats are evicted least recently used first once there are more than
+    `max_entries` of them or their messages exceed `max_bytes` in total.
+    Writes append to the cached chat after they are committed, and deletes
+    invalidate it, so a turn never reads the chat back from the database.
+
+    Cached chats are detached from any session and must be treated as read
+    only. The cache lives in the process, so it is only coherent when a
+    single worker serves the database. Setting `max_entries` to 0 disables it.
+    """
+
+    max_entries: int
+    max_bytes: int
+
+    _entries: OrderedDict[int, CachedChat] = field(default_factory=OrderedDict)
+    _bytes: int = 0
+
+    # Writes that happened while the chat was being loaded, so that a load
+    # racing with a write does not cache a stale chat.
+    _clock: int = 0
+    _loads: dict[int, int] = field(default_factory=dict)
+    _writes: dict[int, int] = field(default_factory=dict)
+
+    def get(self, chat_id: int) -> CachedChat | None:
+        """
+        Get a cached chat, marking it as recently used.
+
+        Args:
+            chat_id (int): The ID of the chat.
+
+        Returns:
+            CachedChat | None: The cached chat, or None on a miss.
+        """
+        entry = self._entries.get(chat_id)
+        if entry is None:
+            metrics.inc("chat_cache_misses_total")
+            return None
+
+        metrics.inc("chat_cache_hits_total")
+        self._entries.move_to_end(chat_id)
+        return entry
+
+    def prompt(self, chat: models.Chat) -> list[dict]:
+        """
+        Get the prompt of a chat, precomputed if the chat is cached.
+
+        Args:
+            chat (models.Chat): The chat, loaded with its messages.
+
+        Returns:
+            list[dict]: The chat's messages in OpenAI format.
+        """
+        entry = self._entries.get(chat.id)
+        if entry is not None and entry.chat is chat:
+            return entry.prompt
+        return [prompt_message(message) for message in chat.messages]
+
+    @contextmanager
+    def loading(self, chat_id: int) -> Iterator[int]:
+        """
+        Track the loading of a chat from the database.
+
+        Yields:
+            int: The token to pass to `put` once the chat is loaded.
+        """
+        self._loads[chat_id] = self._loads.get(chat_id, 0) + 1
+        try:
+            yield self._clock
+        finally:
+            self._loads[chat_id] -= 1
+            if not self._loads[chat_id]:
+                del self._loads[chat_id]
+                self._writes.pop(chat_id, None)
+
+    def put(self, chat: models.Chat, token: int | None = None) -> CachedChat:
+        """
+        Cache a chat with its messages.
+
+        A loaded chat is not cached if it was written to since its loading
+        started. Chats larger than the whole cache are never cached.
+
+        Args:
+            chat (models.Chat): The chat, detached from its session.
+            token (int | None, optional): The token yielded by `loading`.
+                Defaults to None, for chats that were just written.
+
+        Returns:
+            CachedChat: The cache entry, even if it was not cached.
+        """
+        entry = CachedChat.build(chat)
+        if token is not None and self._writes.get(chat.id, token) > token:
+            return entry
+        if not self.max_entries or entry.size > self.max_bytes:
+            return entry
+
+        self._remove(chat.id)
+        self._entries[chat.id] = entry
+        self._bytes += entry.size
+        self._evict()
+        return entry
+
+    def append(self, chat_id: int, message: models.ChatMessage) -> None:
+        """
+        Add a committed message to a cached chat.
+
+        Args:
+            chat_id (int): The ID of the chat.
+            message (models.ChatMessage): The message, detached from its session.
+        """
+        self._written(chat_id)
+        entry = self._entries.get(chat_id)
+        if entry is None:
+            return
+
+        # Replace the lists instead of mutating them, as a template may be
+        # iterating over them.
+        set_committed_value(entry.chat, "messages", [*entry.chat.messages, message])
+        entry.prompt = [*entry.prompt, prompt_message(message)]
+        entry.size += len(message.content)
+        self._bytes += len(message.content)
+        self._entries.move_to_end(chat_id)
+        self._evict()
+
+    def invalidate(self, chat_id: int) -> None:
+        """
+        Remove a chat from the cache.
+
+        Args:
+            chat_id (int): The ID of the chat.
+        """
+        self._written(chat_id)
+        self._remove(chat_id)
+        self._update_gauges()
+
+    def invalidate_user(self, user_id: int) -> None:
+        """
+        Remove all chats of a user from the cache.
+
+        Args:
+            user_id (int): The ID of the user.
+        """
+        chat_ids = [
+            chat_id
+            for chat_id, entry in self._entries.items()
+            if entry.chat.user_id == user_id
+        ]
+        # Chats being loaded are not cached yet and may belong to the user.
+        for chat_id in [*chat_ids, *self._loads]:
+            self.invalidate(chat_id)
+
+    def _written(self, chat_id: int) -> None:
+        self._clock += 1
+        if chat_id in self._loads:
+            self._writes[chat_id] = self._clock
+
+    def _remove(self, chat_id: int) -> None:
+        entry = self._entries.pop(chat_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _evict(self) -> None:
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            metrics.inc("chat_cache_evictions_total")
+        self._update_gauges()
+
+    def _update_gauges(self) -> None:
+        metrics.set("chat_cache_entries", len(self._entries))
+        metrics.set("chat_cache_bytes", self._bytes)
@@ -1,18 +1,21 @@
-from fastapi import APIRouter, Depends, Request, Response
-from fastapi.responses import HTMLResponse
-from markdown import markdown
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import HTMLResponse, StreamingResponse
 from sse_starlette.sse import EventSourceResponse
 
 from app import schemas
 from app.db import models
+from app.rendering import renderer
+from app.scheduler import scheduler
 from app.service import AppService
-from app.utils import get_app_service, get_user, templates
+from app.settings import settings
+from app.utils import get_app_service, get_templates, get_user, query_budget
 
 chat_router = APIRouter()
 
 
 @chat_router.get(
     "/",
+    dependencies=[Depends(query_budget(2))],
     response_class=HTMLResponse,
 )
 async def chats_page(
@@ -34,7 +37,7 @@ async def chats_page(
         HTMLResponse: The rendered HTML response.
     """
     chats = await app_service.get_all_chats(user)
-    res: HTMLResponse = templates.TemplateResponse(
+    res: HTMLResponse = get_templates().TemplateResponse(
         request=request,
         name="chat.html",
         context={"user": user, "chats": chats.all()},
@@ -42,8 +45,61 @@ async def chats_page(
     return res
 
 
+@chat_router.get(
+    "/export",
+    dependencies=[Depends(query_budget(2))],
+)
+async def export_chats(
+    app_service: AppService = Depends(get_app_service),
+    user: models.User = Depends(get_user),
+) -> StreamingResponse:
+    """
+    Handler for exporting the user's chats.
+
+    Streams every chat and message of the user as NDJSON.
+
+    Args:
+        app_service (AppService, optional): The application service dependency. Defaults to Depends(get_app_service).
+        user (models.User, optional): The user dependency. Defaults to Depends(get_user).
+
+    Returns:
+        StreamingResponse: The NDJSON export.
+    """
+    return StreamingResponse(
+        app_service.export_chats(user),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="chats.ndjson"'},
+    )
+
+
+@chat_router.post(
+    "/import",
+)
+async def import_chats(
+    request: Request,
+    app_service: AppService = Depends(get_app_service),
+    user: models.User = Depends(get_user),
+) -> schemas.ImportResult:
+    """
+    Handler for importing chats.
+
+    Reads an NDJSON export from the request body and bulk inserts its chats and
+    messages for the user.
+
+    Args:
+        request (Request): The incoming request.
+        app_service (AppService, optional): The application service dependency. Defaults to Depends(get_app_service).
+        user (models.User, optional): The user dependency. Defaults to Depends(get_user).
+
+    Returns:
+        schemas.ImportResult: The number of imported chats and messages.
+    """
+    return await app_service.import_chats(user, request.stream())
+
+
 @chat_router.get(
     "/{chat_id}",
+    dependencies=[Depends(query_budget(4))],
     response_class=HTMLResponse,
 )
 async def chat_page(
@@ -67,9 +123,11 @@ async def chat_page(
         HTMLResponse: The rendered HTML response.
     """
     chat = await app_service.get_chat_by_id(chat_id, user)
+    if chat is not None:
+        await renderer.render_all(message.content for message in chat.messages)
 
     chats = await app_service.get_all_chats(user)
-    res: HTMLResponse = templates.TemplateResponse(
+    res: HTMLResponse = get_templates().TemplateResponse(
         request=request,
         name="chat-id.html",
         context={"user": user, "chat": chat, "chats": chats.all()},
@@ -79,6 +137,7 @@ async def chat_page(
 
 @chat_router.post(
     "/",
+    dependencies=[Depends(query_budget(3))],
 )
 async def create_chat(
     data: schemas.CreateChat,
@@ -101,8 +160,35 @@ async def create_chat(
     response.headers["HX-Redirect"] = f"/chat/{chat.id}"
 
 
+@chat_router.delete(
+    "/",
+    dependencies=[Depends(query_budget(2))],
+)
+async def delete_chats(
+    data: schemas.DeleteChats,
+    response: Response,
+    app_service: AppService = Depends(get_app_service),
+    user: models.User = Depends(get_user),
+) -> None:
+    """
+    Handler for deleting several chats at once.
+
+    Deletes the chats with the given ids, or all chats of the user, and redirects
+    to the chats page.
+
+    Args:
+        data (schemas.DeleteChats): The chats to delete.
+        response (Response): The response object.
+        app_service (AppService, optional): The application service dependency. Defaults to Depends(get_app_service).
+        user (models.User, optional): The user dependency. Defaults to Depends(get_user).
+    """
+    await app_service.delete_chats(user, None if data.all else data.ids)
+    response.headers["HX-Redirect"] = "/chat"
+
+
 @chat_router.delete(
     "/{chat_id}",
+    dependencies=[Depends(query_budget(2))],
 )
 async def delete_chat(
     chat_id: int,
@@ -126,6 +212,7 @@ async def delete_chat(
 
 @chat_router.post(
     "/{chat_id}/add-message",
+    dependencies=[Depends(query_budget(4))],
     response_class=HTMLResponse,
 )
 async def add_message(
@@ -150,18 +237,16 @@ async def add_message(
     """
     await app_service.add_message(user=user, data=data, chat_id=chat_id)
 
-    chat = await app_service.get_chat_by_id(chat_id, user)
-
-    res: HTMLResponse = templates.TemplateResponse(
+    res: HTMLResponse = get_templates().TemplateResponse(
         request=request,
         name="chat-id-new-message.html",
         context={
             "user": user,
             "message": {
                 "kind": "human",
-                "rendered_content": markdown(data.message, extensions=["fenced_code"]),
+                "rendered_content": await renderer.render(data.message),
             },
-            "chat": chat,
+            "chat": {"id": chat_id},
         },
     )
     return res
@@ -169,6 +254,7 @@ async def add_message(
 
 @chat_router.get(
     "/generate/{chat_id}",
+    dependencies=[Depends(query_budget(4))],
 )
 async def generate(
     chat_id: int,
@@ -179,6 +265,9 @@ async def generate(
     Handler for generating events for a chat.
 
     Generates and returns server-sent events for the chat with the given chat_id.
+    Streams are admitted through the generation scheduler, which rate limits and
+    queues them per user. Heartbeats keep idle connections alive and clients
+    that stop reading are dropped after the send timeout.
 
     Args:
         chat_id (int): The ID of the chat.
@@ -187,5 +276,24 @@ async def generate(
 
     Returns:
         EventSourceResponse: The server-sent events response.
+
+    Raises:
+        HTTPException: If the chat is not found.
     """
-    return EventSourceResponse(app_service.generate(chat_id))
+    # Checked before admission, so that a bad request neither spends a rate
+    # limit token nor fails after the response has started.
+    chat = await app_service.get_chat_by_id(chat_id, user)
+    if chat is None:
+        raise HTTPException(status_code=404, detail="Chat not found")
+
+    ticket = scheduler.ticket(user.id)
+
+    # The stream opens its own short-lived sessions; release the request's
+    # connection now instead of holding it for the whole stream.
+    await app_service.session.close()
+
+    return EventSourceResponse(
+        app_service.generate(chat, ticket),
+        ping=settings.sse.ping_interval,
+        send_timeout=settings.sse.send_timeout,
+    )
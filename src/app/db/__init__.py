@@ -1,4 +1,15 @@
-from .db import AsyncSession, async_session, get_database_url, get_engine, init_models
+from .db import (
+    AsyncSession,
+    QueryStats,
+    async_session,
+    dispose_engine,
+    get_database_url,
+    get_engine,
+    get_sessionmaker,
+    init_models,
+    query_stats,
+    track_queries,
+)
 
 __all__ = [
     "Base",
@@ -9,4 +20,9 @@ __all__ = [
     "init_models",
     "get_database_url",
     "async_session",
+    "get_sessionmaker",
+    "dispose_engine",
+    "QueryStats",
+    "query_stats",
+    "track_queries",
 ]
@@ -1,18 +1,62 @@
-from typing import Any
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import cache
+from typing import Any, Iterator
 
-from sqlalchemy import event
+from sqlalchemy import URL, Connection, event, inspect, text
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     AsyncSession,
     async_sessionmaker,
     create_async_engine,
 )
+from sqlalchemy.orm import Session
 
+from app.metrics import metrics
 from app.settings import settings
 
 from .models import Base
 
 
+@dataclass
+class QueryStats:
+    """
+    Database activity recorded while tracking queries.
+
+    Attributes:
+        queries (int): The number of statements executed.
+        rows (int): The number of ORM rows loaded from the database.
+        elapsed (float): The time spent executing statements, in seconds.
+        budget (int | None): The maximum number of statements, if one is declared.
+    """
+
+    queries: int = 0
+    rows: int = 0
+    elapsed: float = 0.0
+    budget: int | None = None
+
+
+query_stats: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """
+    Record the database activity of the current context.
+
+    Yields:
+        QueryStats: The stats, updated as statements execute.
+    """
+    stats = QueryStats()
+    token = query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        query_stats.reset(token)
+
+
 def get_database_url() -> str:
     """
     Get the URL for the database connection.
@@ -20,25 +64,102 @@ def get_database_url() -> str:
     Returns:
         str: The database URL.
     """
-    return f"sqlite+aiosqlite:///{settings.database.path}"
+    database = settings.database
 
+    if database.backend == "postgres":
+        url = URL.create(
+            "postgresql+asyncpg",
+            username=database.user,
+            password=database.password,
+            host=database.host,
+            port=database.port,
+            database=database.name,
+            query={"prepared_statement_cache_size": str(database.statement_cache_size)},
+        )
+        return url.render_as_string(hide_password=False)
 
+    return f"sqlite+aiosqlite:///{database.path}"
+
+
+def get_engine_options() -> dict[str, Any]:
+    """
+    Get the backend-specific options for the database engine.
+
+    Returns:
+        dict[str, Any]: The keyword arguments for create_async_engine.
+    """
+    database = settings.database
+
+    if database.backend == "postgres":
+        return {
+            "pool_size": database.pool_size,
+            "max_overflow": database.max_overflow,
+            "pool_timeout": database.pool_timeout,
+            "pool_pre_ping": True,
+            "connect_args": {"statement_cache_size": database.statement_cache_size},
+        }
+
+    return {}
+
+
+@cache
 def get_engine() -> AsyncEngine:
     """
-    Get the asynchronous database engine.
+    Get the asynchronous database engine, creating it on first use.
 
     Returns:
         AsyncEngine: The asynchronous database engine.
     """
-    print(get_database_url())
-    print(get_database_url())
-    print(get_database_url())
-    print(get_database_url())
-    return create_async_engine(
+    engine = create_async_engine(
         get_database_url(),
+        **get_engine_options(),
         # echo=True,
     )
 
+    if engine.dialect.name == "sqlite":
+        event.listen(engine.sync_engine, "connect", enable_sqlite_fks)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", start_query_timer)
+    event.listen(engine.sync_engine, "after_cursor_execute", record_query)
+    event.listen(engine.sync_engine, "checkout", record_checkout)
+    event.listen(engine.sync_engine, "checkin", record_checkin)
+
+    return engine
+
+
+@cache
+def get_sessionmaker() -> async_sessionmaker[AsyncSession]:
+    """
+    Get the session factory bound to the database engine.
+
+    Returns:
+        async_sessionmaker[AsyncSession]: The session factory.
+    """
+    return async_sessionmaker(get_engine(), class_=AsyncSession, expire_on_commit=False)
+
+
+def async_session() -> AsyncSession:
+    """
+    Create a new asynchronous session.
+
+    Returns:
+        AsyncSession: The new session.
+    """
+    return get_sessionmaker()()
+
+
+async def dispose_engine() -> None:
+    """
+    Close all pooled connections and forget the engine.
+
+    Returns:
+        None
+    """
+    if get_engine.cache_info().currsize:
+        await get_engine().dispose()
+    get_sessionmaker.cache_clear()
+    get_engine.cache_clear()
+
 
 async def init_models() -> None:
     """
@@ -51,13 +172,49 @@ async def init_models() -> None:
     async with engine.begin() as conn:
         # await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(upgrade_schema)
 
 
-engine = get_engine()
-async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+def upgrade_schema(conn: Connection) -> None:
+    """
+    Add the columns and indexes that are missing from existing tables.
+
+    create_all only creates missing tables, so a database created by an earlier
+    version lacks the columns and indexes added to its tables since. Running
+    this again is a no-op.
+
+    Args:
+        conn (Connection): The database connection.
+
+    Returns:
+        None
+
+    Raises:
+        RuntimeError: If a missing column cannot be added, i.e. it is not nullable.
+    """
+    inspector = inspect(conn)
+    quote = conn.dialect.identifier_preparer.quote
+
+    for table in Base.metadata.sorted_tables:
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in columns:
+                continue
+            if not column.nullable:
+                raise RuntimeError(f"Cannot add non-nullable column {column}")
+
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(
+                text(
+                    f"ALTER TABLE {quote(table.name)} "
+                    f"ADD COLUMN {quote(column.name)} {column_type}"
+                )
+            )
+
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
 
 
-@event.listens_for(engine.sync_engine, "connect")
 def enable_sqlite_fks(dbapi_connection: Any, _: Any) -> None:
     """
     Enable foreign key constraints for a SQLite database connection.
@@ -72,3 +229,80 @@ def enable_sqlite_fks(dbapi_connection: Any, _: Any) -> None:
     cursor = dbapi_connection.cursor()
     cursor.execute("PRAGMA foreign_keys=ON")
     cursor.close()
+
+
+def record_checkout(*_: Any) -> None:
+    """
+    Count a connection checked out of the pool.
+
+    Args:
+        _ (Any): Placeholder arguments.
+
+    Returns:
+        None
+    """
+    metrics.inc("db_pool_checkouts_total")
+    metrics.set("db_pool_checked_out", metrics.gauges.get("db_pool_checked_out", 0) + 1)
+
+
+def record_checkin(*_: Any) -> None:
+    """
+    Count a connection returned to the pool.
+
+    Args:
+        _ (Any): Placeholder arguments.
+
+    Returns:
+        None
+    """
+    metrics.set("db_pool_checked_out", metrics.gauges.get("db_pool_checked_out", 0) - 1)
+
+
+def start_query_timer(conn: Any, *_: Any) -> None:
+    """
+    Remember when a statement started executing.
+
+    Args:
+        conn (Any): The connection executing the statement.
+        _ (Any): Placeholder arguments.
+
+    Returns:
+        None
+    """
+    if query_stats.get() is not None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def record_query(conn: Any, *_: Any) -> None:
+    """
+    Record an executed statement in the current query stats.
+
+    Args:
+        conn (Any): The connection that executed the statement.
+        _ (Any): Placeholder arguments.
+
+    Returns:
+        None
+    """
+    stats = query_stats.get()
+    if stats is None or not conn.info.get("query_start"):
+        return
+
+    stats.queries += 1
+    stats.elapsed += time.perf_counter() - conn.info["query_start"].pop()
+
+
+@event.listens_for(Session, "loaded_as_persistent")
+def record_loaded_row(*_: Any) -> None:
+    """
+    Record an ORM row loaded from the database in the current query stats.
+
+    Args:
+        _ (Any): Placeholder arguments.
+
+    Returns:
+        None
+    """
+    stats = query_stats.get()
+    if stats is not None:
+        stats.rows += 1
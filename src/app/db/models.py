@@ -2,8 +2,7 @@ from __future__ import annotations
 
 from datetime import datetime
 
-from markdown import markdown
-from sqlalchemy import ForeignKey, UniqueConstraint, func
+from sqlalchemy import ForeignKey, Index, UniqueConstraint, func
 from sqlalchemy.ext.asyncio import (
     AsyncAttrs,
 )
@@ -14,6 +13,8 @@ from sqlalchemy.orm import (
     relationship,
 )
 
+from app.rendering import renderer
+
 
 class Base(AsyncAttrs, DeclarativeBase):
     """
@@ -21,6 +22,10 @@ class Base(AsyncAttrs, DeclarativeBase):
     Provides common attributes like create_date and update_date.
     """
 
+    # Fetch server defaults on insert, so that new objects are fully loaded
+    # and remain usable once detached.
+    __mapper_args__ = {"eager_defaults": True}
+
     create_date: Mapped[datetime] = mapped_column(server_default=func.now())
     update_date: Mapped[datetime] = mapped_column(
         server_default=func.now(), onupdate=func.now()
@@ -54,11 +59,19 @@ class Chat(Base):
 
     name: Mapped[str] = mapped_column(nullable=False)
 
-    user_id: Mapped[int] = mapped_column(ForeignKey(User.id, ondelete="CASCADE"))
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey(User.id, ondelete="CASCADE"), index=True
+    )
     user: Mapped[User] = relationship(back_populates="chats")
 
+    deleted_at: Mapped[datetime | None] = mapped_column(default=None)
+
     messages: Mapped[list[ChatMessage]] = relationship(
-        back_populates="chat", cascade="all, delete-orphan"
+        back_populates="chat", cascade="all, delete-orphan", passive_deletes=True
+    )
+
+    archive: Mapped[ChatArchive | None] = relationship(
+        back_populates="chat", cascade="all, delete-orphan", passive_deletes=True
     )
 
 
@@ -68,6 +81,9 @@ class ChatMessage(Base):
     """
 
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        Index("ix_chat_messages_chat_id_create_date", "chat_id", "create_date"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
 
@@ -82,6 +98,43 @@ class ChatMessage(Base):
     def rendered_content(self) -> str:
         """
         Renders the content of the message as HTML using Markdown.
+
+        Large messages must have been rendered ahead of time with
+        `renderer.render`, otherwise they are shown as plaintext.
         """
-        res: str = markdown(self.content, extensions=["fenced_code"])
-        return res
+        return renderer.render_now(self.content)
+
+
+class ArchiveDictionary(Base):
+    """
+    Represents a compression dictionary shared by chat archives.
+    """
+
+    __tablename__ = "archive_dictionaries"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+
+    codec: Mapped[str] = mapped_column(nullable=False)
+
+    data: Mapped[bytes] = mapped_column(nullable=False)
+
+
+class ChatArchive(Base):
+    """
+    Represents the compressed messages of an inactive chat.
+    """
+
+    __tablename__ = "chat_archives"
+
+    chat_id: Mapped[int] = mapped_column(
+        ForeignKey(Chat.id, ondelete="CASCADE"), primary_key=True
+    )
+    chat: Mapped[Chat] = relationship(back_populates="archive")
+
+    codec: Mapped[str] = mapped_column(nullable=False)
+    dictionary_id: Mapped[int | None] = mapped_column(ForeignKey(ArchiveDictionary.id))
+
+    message_count: Mapped[int] = mapped_column(nullable=False)
+    last_message_date: Mapped[datetime] = mapped_column(nullable=False)
+
+    data: Mapped[bytes] = mapped_column(nullable=False)
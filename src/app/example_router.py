@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Request
 from fastapi.responses import HTMLResponse
 
-from app.utils import templates
+from app.utils import get_templates
 
 example_router = APIRouter()
 
@@ -13,7 +13,7 @@ example_router = APIRouter()
 async def index_page(
     request: Request,
 ) -> HTMLResponse:
-    res: HTMLResponse = templates.TemplateResponse(
+    res: HTMLResponse = get_templates().TemplateResponse(
         request=request,
         name="example/index.html",
         context={},
@@ -0,0 +1,274 @@
+import asyncio
+import logging
+import time
+from contextlib import suppress
+from functools import cache
+from types import ModuleType
+from typing import TYPE_CHECKING, Any, AsyncGenerator, Callable
+
+from app.metrics import metrics
+from app.settings import settings
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+
+@cache
+def get_litellm() -> ModuleType:
+    """
+    Import litellm on first use.
+
+    litellm is by far the heaviest import of the application, so it is kept out
+    of module import time. Use `load_litellm` from the event loop.
+
+    Returns:
+        ModuleType: The litellm module.
+    """
+    import litellm
+
+    return litellm
+
+
+async def load_litellm() -> ModuleType:
+    """
+    Get litellm, importing it in a worker thread on first use so that the
+    import does not block the event loop.
+
+    Returns:
+        ModuleType: The litellm module, using the shared HTTP client.
+    """
+    if not get_litellm.cache_info().currsize:
+        await asyncio.to_thread(get_litellm)
+
+    litellm = get_litellm()
+    setattr(litellm, "aclient_session", get_http_client())
+    return litellm
+
+
+@cache
+def get_http_client() -> "httpx.AsyncClient":
+    """
+    Get the HTTP client shared by all LLM calls, creating it on first use.
+
+    Sharing one keep-alive pool across requests avoids paying for a new TCP
+    and TLS handshake on every completion.
+
+    Returns:
+        httpx.AsyncClient: The HTTP client.
+    """
+    import httpx
+
+    llm = settings.llm
+    return httpx.AsyncClient(
+        http2=llm.http2,
+        limits=httpx.Limits(
+            max_connections=llm.max_connections,
+            max_keepalive_connections=llm.max_keepalive_connections,
+            keepalive_expiry=llm.keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(llm.timeout, connect=10.0),
+        event_hooks={"request": [_trace_request]},
+    )
+
+
+async def _trace_request(request: "httpx.Request") -> None:
+    metrics.inc("llm_http_requests_total")
+    request.extensions["trace"] = _trace_connection
+
+
+async def _trace_connection(event: str, _: dict[str, Any]) -> None:
+    if event == "connection.connect_tcp.complete":
+        metrics.inc("llm_http_connections_opened_total")
+    elif event == "connection.start_tls.complete":
+        metrics.inc("llm_http_tls_handshakes_total")
+
+
+async def warm_up() -> None:
+    """
+    Open connections to the LLM provider ahead of the first completion.
+
+    Failures are only logged, as the provider may be unreachable at startup.
+    """
+    client = get_http_client()
+    results = await asyncio.gather(
+        *(
+            client.head(settings.llm.base_url or DEFAULT_BASE_URL, timeout=5.0)
+            for _ in range(settings.llm.warmup_connections)
+        ),
+        return_exceptions=True,
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            logger.warning("LLM connection warm-up failed: %r", result)
+
+
+async def close() -> None:
+    """
+    Close the shared HTTP client.
+    """
+    if get_litellm.cache_info().currsize:
+        setattr(get_litellm(), "aclient_session", None)
+        get_litellm.cache_clear()
+
+    if get_http_client.cache_info().currsize:
+        await get_http_client().aclose()
+    get_http_client.cache_clear()
+
+
+async def completion_stream(
+    messages: list[dict], model: str
+) -> AsyncGenerator[str, None]:
+    """
+    Stream a single chat completion request.
+
+    Args:
+        messages (list[dict]): The chat messages in OpenAI format.
+        model (str): The model to use.
+
+    Yields:
+        str: The non-empty content deltas of the completion.
+    """
+    litellm = await load_litellm()
+    response = await litellm.acompletion(
+        model=model, messages=messages, stream=True, api_base=settings.llm.base_url
+    )
+
+    async for chunk in response:
+        content = chunk.choices[0].delta.content
+        if content:
+            yield content
+
+
+async def stream_completion(
+    messages: list[dict], model: str | None = None
+) -> AsyncGenerator[str, None]:
+    """
+    Stream a chat completion.
+
+    When LLM_HEDGE_DELAY is set and the first token takes longer than that, a
+    second request is sent to LLM_HEDGE_MODEL (or the same model) and whichever
+    stream produces a token first is used.
+
+    Args:
+        messages (list[dict]): The chat messages in OpenAI format.
+        model (str | None, optional): The model to use. Defaults to LLM_MODEL.
+
+    Yields:
+        str: The non-empty content deltas of the completion.
+    """
+    model = model or settings.llm.model
+    hedge_delay = settings.llm.hedge_delay
+
+    if hedge_delay is None:
+        stream = completion_stream(messages, model)
+    else:
+        hedge_model = settings.llm.hedge_model or model
+        stream = await hedged_stream(
+            lambda: completion_stream(messages, model),
+            lambda: completion_stream(messages, hedge_model),
+            hedge_delay,
+        )
+
+    async for content in stream:
+        yield content
+
+
+async def _prepend(
+    first: str, rest: AsyncGenerator[str, None]
+) -> AsyncGenerator[str, None]:
+    try:
+        yield first
+        async for content in rest:
+            yield content
+    finally:
+        await rest.aclose()
+
+
+async def _empty() -> AsyncGenerator[str, None]:
+    return
+    yield
+
+
+async def hedged_stream(
+    primary: Callable[[], AsyncGenerator[str, None]],
+    backup: Callable[[], AsyncGenerator[str, None]],
+    delay: float,
+) -> AsyncGenerator[str, None]:
+    """
+    Race two streams on their first item.
+
+    The primary stream is started immediately and the backup one only if the
+    primary has not produced anything after `delay` seconds, or failed or ended
+    early. The first stream to produce an item wins and the other one is
+    cancelled and closed. A stream that fails or ends before producing anything
+    leaves the race to the other.
+
+    Args:
+        primary (Callable[[], AsyncGenerator[str, None]]): Starts the primary stream.
+        backup (Callable[[], AsyncGenerator[str, None]]): Starts the backup stream.
+        delay (float): Seconds to wait for the primary before hedging.
+
+    Returns:
+        AsyncGenerator[str, None]: The winning stream, starting with its first
+            item, or an empty stream if no stream produced anything.
+
+    Raises:
+        Exception: The first error if no stream produced anything and one failed.
+    """
+    start = time.perf_counter()
+    metrics.inc("llm_requests_total")
+
+    primary_stream = primary()
+    primary_first = asyncio.ensure_future(anext(primary_stream, None))
+    streams = {primary_first: primary_stream}
+    hedged = False
+
+    errors: list[BaseException] = []
+    try:
+        done, _ = await asyncio.wait(streams, timeout=delay)
+        if (
+            not done
+            or primary_first.exception() is not None
+            or primary_first.result() is None
+        ):
+            hedged = True
+            metrics.inc("llm_hedged_total")
+            backup_stream = backup()
+            streams[asyncio.ensure_future(anext(backup_stream, None))] = backup_stream
+
+        while streams:
+            done, _ = await asyncio.wait(streams, return_when=asyncio.FIRST_COMPLETED)
+            # Streams finishing together are handled in start order, so that
+            # the primary wins ties and its error is the one raised.
+            for task in [task for task in streams if task in done]:
+                stream = streams.pop(task)
+                error = task.exception()
+                first = task.result() if error is None else None
+                if first is not None:
+                    ttft = time.perf_counter() - start
+                    metrics.observe("llm_time_to_first_token_seconds", ttft)
+                    if hedged:
+                        metrics.observe("llm_hedged_time_to_first_token_seconds", ttft)
+                    if task is not primary_first:
+                        metrics.inc("llm_hedge_wins_total")
+                    return _prepend(first, stream)
+
+                if error is not None:
+                    errors.append(error)
+                await stream.aclose()
+    finally:
+        for task, stream in streams.items():
+            task.cancel()
+            with suppress(asyncio.CancelledError, Exception):
+                await task
+            await stream.aclose()
+
+    if not errors:
+        return _empty()
+
+    metrics.inc("llm_errors_total")
+    raise errors[0]
@@ -0,0 +1,101 @@
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any
+
+
+@dataclass
+class Summary:
+    """
+    Running count, sum and maximum of an observed value.
+    """
+
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    def observe(self, value: float) -> None:
+        """
+        Record a new observation.
+
+        Args:
+            value (float): The observed value.
+        """
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    @property
+    def mean(self) -> float:
+        """
+        The mean of all observations, or 0 when nothing was observed.
+        """
+        return self.total / self.count if self.count else 0.0
+
+
+@dataclass
+class Metrics:
+    """
+    In-process registry of counters, gauges and summaries.
+    """
+
+    counters: defaultdict[str, float] = field(
+        default_factory=lambda: defaultdict(float)
+    )
+    gauges: dict[str, float] = field(default_factory=dict)
+    summaries: defaultdict[str, Summary] = field(
+        default_factory=lambda: defaultdict(Summary)
+    )
+
+    def inc(self, name: str, value: float = 1.0) -> None:
+        """
+        Increment a counter.
+
+        Args:
+            name (str): The name of the counter.
+            value (float, optional): The increment. Defaults to 1.0.
+        """
+        self.counters[name] += value
+
+    def set(self, name: str, value: float) -> None:
+        """
+        Set a gauge to the given value.
+
+        Args:
+            name (str): The name of the gauge.
+            value (float): The new value.
+        """
+        self.gauges[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        """
+        Record an observation in a summary.
+
+        Args:
+            name (str): The name of the summary.
+            value (float): The observed value.
+        """
+        self.summaries[name].observe(value)
+
+    def snapshot(self) -> dict[str, Any]:
+        """
+        Get a JSON-serializable view of all metrics.
+
+        Returns:
+            dict[str, Any]: The counters, gauges and summaries.
+        """
+        return {
+            "counters": dict(self.counters),
+            "gauges": dict(self.gauges),
+            "summaries": {
+                name: {
+                    "count": summary.count,
+                    "total": summary.total,
+                    "mean": summary.mean,
+                    "max": summary.max,
+                }
+                for name, summary in self.summaries.items()
+            },
+        }
+
+
+metrics = Metrics()
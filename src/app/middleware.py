@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import random
+import re
+import secrets
+import time
+from pathlib import Path
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.db import track_queries
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class QueryStatsMiddleware:
+    """
+    Tracks the database activity of each request and reports it in the
+    `X-DB-Queries`, `X-DB-Rows` and `X-DB-Time` response headers, then checks
+    it against the query budget declared by the route.
+
+    Streaming responses only report the activity that happened before the
+    response started, but their whole body counts towards the budget.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track_queries() as stats:
+
+            async def send_with_stats(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    headers = MutableHeaders(scope=message)
+                    headers["X-DB-Queries"] = str(stats.queries)
+                    headers["X-DB-Rows"] = str(stats.rows)
+                    headers["X-DB-Time"] = f"{stats.elapsed * 1000:.2f}ms"
+                await send(message)
+
+            await self.app(scope, receive, send_with_stats)
+
+        if stats.budget is not None and stats.queries > stats.budget:
+            message = (
+                f"{scope['method']} {scope['path']} ran {stats.queries} queries, "
+                f"budget is {stats.budget}"
+            )
+            if settings.debug.enforce_query_budgets:
+                raise RuntimeError(message)
+            logger.warning(message)
+
+
+class ProfilingMiddleware:
+    """
+    Captures a statistical profile of sampled requests, async frames included,
+    and writes it as a speedscope file to the profile directory.
+
+    A request is profiled when its `X-Profile` header matches the configured
+    token, or at random with the configured sample rate.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self.directory = Path(settings.debug.profile_dir)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def should_profile(self, scope: Scope) -> bool:
+        """
+        Decide whether to profile a request.
+
+        Args:
+            scope (Scope): The ASGI scope of the request.
+
+        Returns:
+            bool: True if the request should be profiled.
+        """
+        token = settings.debug.profile_token
+        if token is not None:
+            header = Headers(scope=scope).get("x-profile")
+            # Compare bytes, as compare_digest rejects non-ASCII strings. Header
+            # values are decoded as latin-1, so this recovers the raw bytes.
+            if header is not None and secrets.compare_digest(
+                header.encode("latin-1"), token.encode()
+            ):
+                return True
+
+        # Sampling is not a security decision.
+        return random.random() < settings.debug.profile_sample_rate  # nosec B311
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        from pyinstrument import Profiler
+        from pyinstrument.renderers import SpeedscopeRenderer
+
+        profiler = Profiler(interval=settings.debug.profile_interval)
+        profiler.start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.stop()
+
+            name = re.sub(r"[^\w-]+", "_", scope["path"]).strip("_") or "root"
+            path = self.directory / (
+                f"{time.strftime('%Y%m%d-%H%M%S')}-{scope['method']}-{name}"
+                f"-{secrets.token_hex(3)}.speedscope.json"
+            )
+            output = profiler.output(SpeedscopeRenderer())
+            await asyncio.to_thread(path.write_text, output)
+            logger.info(
+                "Wrote profile of %s %s to %s", scope["method"], scope["path"], path
+            )
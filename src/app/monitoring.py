@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from contextlib import suppress
+from dataclasses import dataclass, field
+
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LoopLagMonitor:
+    """
+    Detects calls that block the event loop.
+
+    A task on the loop records a heartbeat every `interval` seconds, and a
+    watchdog thread logs the loop thread's stack whenever the heartbeat is
+    older than `threshold`, pointing at the blocking call (bcrypt, markdown,
+    ...) while it is still running.
+    """
+
+    threshold: float
+    interval: float = 0.05
+
+    _heartbeat: float = field(default=0.0, init=False)
+    _loop_thread_id: int = field(default=0, init=False)
+    _task: asyncio.Task | None = field(default=None, init=False)
+    _stop: threading.Event = field(default_factory=threading.Event, init=False)
+
+    def start(self) -> None:
+        """
+        Start monitoring the running event loop.
+        """
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._beat())
+        threading.Thread(
+            target=self._watch, name="loop-lag-monitor", daemon=True
+        ).start()
+
+    async def stop(self) -> None:
+        """
+        Stop monitoring.
+        """
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+
+    async def _beat(self) -> None:
+        while True:
+            self._heartbeat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = time.monotonic() - self._heartbeat - self.interval
+            metrics.observe("event_loop_lag_seconds", max(lag, 0.0))
+
+    def _watch(self) -> None:
+        reported = 0.0
+        while not self._stop.wait(self.interval):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat - self.interval
+            if blocked < self.threshold or heartbeat == reported:
+                continue
+
+            reported = heartbeat
+            metrics.inc("event_loop_blocked_total")
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame, limit=20)) if frame else ""
+            logger.warning(
+                "Event loop blocked for more than %.3fs in:\n%s", blocked, stack
+            )
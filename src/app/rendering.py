@@ -0,0 +1,197 @@
+import asyncio
+import html
+import logging
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Iterable
+
+from markdown import markdown
+
+from app.metrics import metrics
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+def to_html(text: str) -> str:
+    """
+    Render markdown to HTML.
+
+    Args:
+        text (str): The markdown.
+
+    Returns:
+        str: The HTML.
+    """
+    return markdown(text, extensions=["fenced_code"])
+
+
+def to_plaintext(text: str) -> str:
+    """
+    Render text as an escaped preformatted block, without parsing it.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        str: The HTML.
+    """
+    return f"<pre><code>{html.escape(text)}</code></pre>"
+
+
+@dataclass
+class MarkdownRenderer:
+    """
+    Renders chat messages without blocking the event loop.
+
+    Messages up to `inline_max_size` characters are rendered on the event
+    loop, as that is cheaper than a round trip to another process. Larger
+    ones are rendered in a process pool, and fall back to escaped plaintext
+    when they exceed `max_size` or take longer than `timeout` seconds. Only
+    the former fallback is cached, a timed out message is rendered again the
+    next time.
+
+    A render that timed out keeps its worker busy until it completes, so
+    while the pool is saturated further large messages fall back as well.
+
+    Rendered messages are cached by content, up to `cache_max_bytes` of HTML,
+    so that templates can read them synchronously once they were rendered.
+    """
+
+    inline_max_size: int
+    max_size: int
+    timeout: float
+    workers: int
+    cache_max_bytes: int
+
+    _pool: ProcessPoolExecutor | None = field(default=None, init=False)
+    _cache: OrderedDict[str, str] = field(default_factory=OrderedDict, init=False)
+    _cache_bytes: int = field(default=0, init=False)
+
+    def start(self) -> None:
+        """
+        Start the worker processes ahead of the first large message.
+        """
+        pool = self._get_pool()
+        for _ in range(self.workers):
+            pool.submit(to_html, "")
+
+    def close(self, wait: bool = False) -> None:
+        """
+        Stop the worker processes.
+
+        Args:
+            wait (bool, optional): Whether to wait for the workers to exit.
+                Defaults to False. The process must wait on exit, otherwise
+                it can leave its workers running.
+        """
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._pool = None
+
+    def render_now(self, text: str) -> str:
+        """
+        Render a message without waiting on the process pool.
+
+        Large messages that were not rendered ahead of time by `render` are
+        returned as escaped plaintext.
+
+        Args:
+            text (str): The markdown.
+
+        Returns:
+            str: The HTML.
+        """
+        rendered = self._cache.get(text)
+        if rendered is not None:
+            self._cache.move_to_end(text)
+            return rendered
+
+        if len(text) <= self.inline_max_size:
+            return self._store(text, to_html(text))
+
+        return to_plaintext(text)
+
+    async def render(self, text: str) -> str:
+        """
+        Render a message, in the process pool if it is large.
+
+        Args:
+            text (str): The markdown.
+
+        Returns:
+            str: The HTML.
+        """
+        if len(text) <= self.inline_max_size or text in self._cache:
+            return self.render_now(text)
+
+        if len(text) > self.max_size:
+            metrics.inc("markdown_too_large_total")
+            return self._store(text, to_plaintext(text))
+
+        metrics.inc("markdown_offloaded_total")
+        try:
+            rendered = await asyncio.wait_for(
+                asyncio.wrap_future(self._get_pool().submit(to_html, text)),
+                self.timeout,
+            )
+        except TimeoutError:
+            metrics.inc("markdown_timeouts_total")
+            logger.warning("Rendering a %d character message timed out", len(text))
+            # Fallbacks are not cached, so the message is rendered once the
+            # pool has capacity again.
+            return to_plaintext(text)
+        except BrokenProcessPool:
+            logger.exception("The markdown worker pool broke, restarting it")
+            self.close()
+            return to_plaintext(text)
+
+        return self._store(text, rendered)
+
+    async def render_all(self, texts: Iterable[str]) -> None:
+        """
+        Render several messages ahead of a template reading them with
+        `render_now`.
+
+        Args:
+            texts (Iterable[str]): The markdown of the messages.
+        """
+        await asyncio.gather(
+            *(self.render(text) for text in texts if len(text) > self.inline_max_size)
+        )
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Forking a process that runs threads (the database driver, the
+            # loop lag monitor) is unsafe, so workers are spawned instead.
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    def _store(self, text: str, rendered: str) -> str:
+        if len(rendered) > self.cache_max_bytes:
+            return rendered
+
+        if text not in self._cache:
+            self._cache[text] = rendered
+            self._cache_bytes += len(rendered)
+        self._cache.move_to_end(text)
+
+        while self._cache_bytes > self.cache_max_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= len(evicted)
+        return rendered
+
+
+renderer = MarkdownRenderer(
+    inline_max_size=settings.rendering.inline_max_size,
+    max_size=settings.rendering.max_size,
+    timeout=settings.rendering.timeout,
+    workers=settings.rendering.workers,
+    cache_max_bytes=settings.rendering.cache_max_bytes,
+)
@@ -0,0 +1,240 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import AsyncGenerator
+
+from fastapi import HTTPException
+
+from app.metrics import metrics
+from app.settings import settings
+
+
+@dataclass
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `rate` tokens per second.
+    """
+
+    rate: float
+    capacity: float
+    tokens: float = field(init=False)
+    updated: float = field(default_factory=time.monotonic)
+
+    def __post_init__(self) -> None:
+        self.tokens = self.capacity
+
+    def refill(self) -> None:
+        """
+        Add the tokens accumulated since the last refill.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self) -> float:
+        """
+        Take a token from the bucket.
+
+        Returns:
+            float: 0 if a token was taken, otherwise the seconds until one is available.
+        """
+        self.refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else math.inf
+
+
+@dataclass(eq=False)
+class Ticket:
+    """
+    A user's admitted request for a generation slot.
+    """
+
+    scheduler: "GenerationScheduler"
+    user_id: int
+    enqueued: float = field(default_factory=time.monotonic)
+    admitted: bool = False
+    released: bool = False
+
+    async def wait(self) -> AsyncGenerator[int, None]:
+        """
+        Wait for a generation slot.
+
+        Yields:
+            int: The 1-based queue position, each time it changes while waiting.
+        """
+        scheduler = self.scheduler
+        scheduler._enqueue(self)
+
+        last_position = 0
+        try:
+            while not self.admitted:
+                changed = scheduler._changed
+                position = scheduler._position(self)
+                if position != last_position:
+                    last_position = position
+                    yield position
+                if not self.admitted:
+                    await changed.wait()
+        except BaseException:
+            if self.admitted:
+                self.release()
+            else:
+                scheduler._dequeue(self)
+            raise
+
+    def release(self) -> None:
+        """
+        Give the generation slot back to the scheduler.
+        """
+        if self.admitted and not self.released:
+            self.released = True
+            self.scheduler._finish(self)
+
+
+@dataclass
+class GenerationScheduler:
+    """
+    Admission control for generation streams.
+
+    Bounds concurrent streams globally and per user, rate limits new streams
+    per user with a token bucket and serves queued users round-robin.
+    """
+
+    max_concurrency: int
+    max_per_user: int
+    rate: float
+    burst: int
+    max_queue: int
+
+    running: int = field(default=0, init=False)
+    running_per_user: dict[int, int] = field(default_factory=dict, init=False)
+    queues: OrderedDict[int, deque[Ticket]] = field(
+        default_factory=OrderedDict, init=False
+    )
+    buckets: dict[int, TokenBucket] = field(default_factory=dict, init=False)
+    _changed: asyncio.Event = field(default_factory=asyncio.Event, init=False)
+
+    @property
+    def queued(self) -> int:
+        """
+        The number of tickets waiting for a slot.
+        """
+        return sum(len(queue) for queue in self.queues.values())
+
+    def ticket(self, user_id: int) -> Ticket:
+        """
+        Admit a new generation request for a user.
+
+        Args:
+            user_id (int): The ID of the user.
+
+        Returns:
+            Ticket: The ticket to wait on for a generation slot.
+
+        Raises:
+            HTTPException: If the user is rate limited or the queue is full.
+        """
+        bucket = self.buckets.get(user_id)
+        if bucket is None:
+            if len(self.buckets) > 10_000:
+                self._prune_buckets()
+            bucket = self.buckets[user_id] = TokenBucket(self.rate, self.burst)
+
+        retry_after = bucket.take()
+        if retry_after:
+            metrics.inc("generate_rate_limited_total")
+            raise HTTPException(
+                status_code=429,
+                detail="Too many generation requests",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+
+        if self.queued >= self.max_queue:
+            metrics.inc("generate_queue_rejected_total")
+            raise HTTPException(status_code=503, detail="Generation queue is full")
+
+        return Ticket(self, user_id)
+
+    def _prune_buckets(self) -> None:
+        for user_id, bucket in list(self.buckets.items()):
+            bucket.refill()
+            if bucket.tokens >= bucket.capacity:
+                del self.buckets[user_id]
+
+    def _enqueue(self, ticket: Ticket) -> None:
+        self.queues.setdefault(ticket.user_id, deque()).append(ticket)
+        self._dispatch()
+
+    def _dequeue(self, ticket: Ticket) -> None:
+        queue = self.queues.get(ticket.user_id)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del self.queues[ticket.user_id]
+            self._dispatch()
+
+    def _finish(self, ticket: Ticket) -> None:
+        self.running -= 1
+        self.running_per_user[ticket.user_id] -= 1
+        if not self.running_per_user[ticket.user_id]:
+            del self.running_per_user[ticket.user_id]
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """
+        Start queued tickets while slots are free, one user at a time.
+        """
+        while self.running < self.max_concurrency:
+            for user_id in self.queues:
+                if self.running_per_user.get(user_id, 0) < self.max_per_user:
+                    break
+            else:
+                break
+
+            # Moving the user to the back of the rotation after each start
+            # keeps a user with many queued tickets from starving the others.
+            queue = self.queues.pop(user_id)
+            ticket = queue.popleft()
+            if queue:
+                self.queues[user_id] = queue
+
+            ticket.admitted = True
+            self.running += 1
+            self.running_per_user[user_id] = self.running_per_user.get(user_id, 0) + 1
+            metrics.observe(
+                "generate_queue_wait_seconds", time.monotonic() - ticket.enqueued
+            )
+
+        metrics.set("generate_queue_depth", self.queued)
+        metrics.set("generate_running", self.running)
+
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def _position(self, ticket: Ticket) -> int:
+        """
+        Estimate a queued ticket's position in the round-robin order.
+        """
+        index = self.queues[ticket.user_id].index(ticket)
+        position = 1
+        ahead_in_round = True
+        for user_id, queue in self.queues.items():
+            if user_id == ticket.user_id:
+                ahead_in_round = False
+            position += min(len(queue), index)
+            if ahead_in_round and len(queue) > index:
+                position += 1
+        return position
+
+
+scheduler = GenerationScheduler(
+    max_concurrency=settings.generation.max_concurrency,
+    max_per_user=settings.generation.max_per_user,
+    rate=settings.generation.rate,
+    burst=settings.generation.burst,
+    max_queue=settings.generation.max_queue,
+)
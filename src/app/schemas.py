@@ -1,4 +1,7 @@
-from pydantic import BaseModel
+from datetime import datetime
+from typing import Annotated, Literal
+
+from pydantic import BaseModel, Field, TypeAdapter
 
 
 class Login(BaseModel):
@@ -47,3 +50,71 @@ class AddMessage(BaseModel):
     """
 
     message: str
+
+
+class DeleteChats(BaseModel):
+    """
+    Represents the chats to delete in bulk.
+
+    Attributes:
+        ids (list[int]): The IDs of the chats to delete.
+        all (bool): Whether to delete all chats of the user instead.
+    """
+
+    ids: list[int] = []
+    all: bool = False
+
+
+class ExportedChat(BaseModel):
+    """
+    Represents a chat line of an NDJSON export.
+
+    Attributes:
+        type (Literal["chat"]): The record type.
+        id (int): The ID of the chat in the export.
+        name (str): The name of the chat.
+    """
+
+    type: Literal["chat"] = "chat"
+    id: int
+    name: str
+
+
+MessageKind = Literal["human", "assistant"]
+
+
+class ExportedMessage(BaseModel):
+    """
+    Represents a message line of an NDJSON export.
+
+    Attributes:
+        type (Literal["message"]): The record type.
+        chat_id (int): The ID of the chat in the export.
+        kind (MessageKind): The kind of message, "human" or "assistant".
+        content (str): The message content.
+        create_date (datetime | None): When the message was created.
+    """
+
+    type: Literal["message"] = "message"
+    chat_id: int
+    kind: MessageKind
+    content: str
+    create_date: datetime | None = None
+
+
+ExportRecord: TypeAdapter[ExportedChat | ExportedMessage] = TypeAdapter(
+    Annotated[ExportedChat | ExportedMessage, Field(discriminator="type")]
+)
+
+
+class ImportResult(BaseModel):
+    """
+    Represents the outcome of a chat import.
+
+    Attributes:
+        chats (int): The number of imported chats.
+        messages (int): The number of imported messages.
+    """
+
+    chats: int
+    messages: int
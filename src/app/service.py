@@ -1,15 +1,45 @@
+from contextlib import aclosing, asynccontextmanager
 from dataclasses import dataclass
-from typing import AsyncGenerator
+from datetime import UTC, datetime, timedelta
+from typing import AsyncGenerator, AsyncIterator, ClassVar, cast
 
 import bcrypt
-import litellm
 from fastapi import HTTPException
 from markdown import markdown
-from sqlalchemy import ScalarResult, func, select
-from sqlalchemy.orm import selectinload
-
-from app import schemas
-from app.db import AsyncSession, models
+from pydantic import ValidationError
+from sqlalchemy import (
+    ScalarResult,
+    and_,
+    delete,
+    func,
+    insert,
+    select,
+    true,
+    update,
+)
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app import archive, llm, schemas
+from app.cache import CachedChat, ChatCache, get_cache_size
+from app.db import AsyncSession, async_session, models
+from app.rendering import renderer
+from app.scheduler import Ticket
+from app.settings import settings
+from app.streaming import buffered
+
+
+async def _iter_lines(data: AsyncIterator[bytes]) -> AsyncGenerator[bytes, None]:
+    """
+    Split a stream of byte chunks into lines.
+    """
+    buffer = b""
+    async for chunk in data:
+        *lines, buffer = (buffer + chunk).split(b"\n")
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
 
 
 @dataclass
@@ -20,6 +50,34 @@ class AppService:
 
     session: AsyncSession
 
+    # Shared by all requests of the process.
+    chat_cache: ClassVar[ChatCache] = ChatCache(
+        max_entries=get_cache_size(),
+        max_bytes=settings.chats.cache_max_bytes,
+    )
+
+    @property
+    def dialect(self) -> str:
+        """
+        Get the name of the database dialect the session is bound to.
+
+        Returns:
+            str: The dialect name, e.g. "sqlite" or "postgresql".
+        """
+        return self.session.get_bind().dialect.name
+
+    @asynccontextmanager
+    async def unit_of_work(self) -> AsyncGenerator[AsyncSession, None]:
+        """
+        Open a short-lived session and transaction, independent of the request
+        session, for work done inside long-lived streams.
+
+        Yields:
+            AsyncSession: The session, committed and closed on exit.
+        """
+        async with async_session() as session, session.begin():
+            yield session
+
     async def get(self) -> ScalarResult[models.User]:
         """
         Get a list of users.
@@ -109,6 +167,31 @@ class AppService:
         """
         session = self.session
         async with session.begin():
+            if self.dialect == "postgresql":
+                # A LATERAL top-1 lookup walks the (chat_id, create_date) index
+                # once per chat instead of aggregating every message.
+                last_message = (
+                    select(models.ChatMessage.create_date.label("max_date"))
+                    .where(models.ChatMessage.chat_id == models.Chat.id)
+                    .order_by(models.ChatMessage.create_date.desc())
+                    .limit(1)
+                    .lateral()
+                )
+                last_activity = func.coalesce(
+                    last_message.c.max_date, models.ChatArchive.last_message_date
+                )
+                chats = await self.session.scalars(
+                    select(models.Chat)
+                    .where(
+                        models.Chat.user_id == user.id, models.Chat.deleted_at.is_(None)
+                    )
+                    .outerjoin(last_message, true())
+                    .outerjoin(models.ChatArchive)
+                    .where(last_activity.is_not(None))
+                    .order_by(last_activity.desc())
+                )
+                return chats
+
             subquery = (
                 select(
                     models.ChatMessage.chat_id,
@@ -118,12 +201,17 @@ class AppService:
                 .group_by(models.ChatMessage.chat_id)
                 .alias()
             )
+            # Archived chats may have no live messages left.
+            last_activity = func.coalesce(
+                subquery.c.max_date, models.ChatArchive.last_message_date
+            )
             chats = await self.session.scalars(
                 select(models.Chat)
-                .where(models.Chat.user_id == user.id)
-                .join(subquery, models.Chat.id == subquery.c.chat_id)
-                .order_by(subquery.c.max_date.desc())
-                .options(selectinload(models.Chat.messages))
+                .where(models.Chat.user_id == user.id, models.Chat.deleted_at.is_(None))
+                .outerjoin(subquery, models.Chat.id == subquery.c.chat_id)
+                .outerjoin(models.ChatArchive)
+                .where(last_activity.is_not(None))
+                .order_by(last_activity.desc())
             )
 
         return chats
@@ -154,12 +242,104 @@ class AppService:
             HTTPException: If the chat is not found.
         """
         async with self.session.begin():
-            chat = await self.session.scalar(
+            entry = await self._load_chat(self.session, chat_id)
+
+        if entry is None or entry.chat.user_id != user.id:
+            return None
+        return entry.chat
+
+    async def _load_chat(
+        self, session: AsyncSession, chat_id: int
+    ) -> CachedChat | None:
+        """
+        Get a chat with its messages from the chat cache, loading it on a miss.
+
+        Args:
+            session (AsyncSession): The session to load the chat with.
+            chat_id (int): The ID of the chat.
+
+        Returns:
+            CachedChat | None: The cached chat, or None if it does not exist.
+        """
+        entry = self.chat_cache.get(chat_id)
+        if entry is not None:
+            return entry
+
+        with self.chat_cache.loading(chat_id) as token:
+            chat = await session.scalar(
                 select(models.Chat)
-                .where(models.Chat.id == chat_id and models.Chat.user_id == user.id)
-                .options(selectinload(models.Chat.messages))
+                .where(models.Chat.id == chat_id, models.Chat.deleted_at.is_(None))
+                .options(
+                    selectinload(models.Chat.messages),
+                    joinedload(models.Chat.archive),
+                )
             )
-        return chat
+            if chat is None:
+                return None
+
+            await self._restore_archived_messages(session, chat)
+            session.expunge(chat)
+            return self.chat_cache.put(chat, token)
+
+    async def _get_dictionary(
+        self, session: AsyncSession, dictionary_id: int | None
+    ) -> bytes | None:
+        """
+        Get an archive dictionary, loading it on first use.
+
+        Args:
+            session (AsyncSession): The session to load the dictionary with.
+            dictionary_id (int | None): The ID of the dictionary.
+
+        Returns:
+            bytes | None: The dictionary, or None if no dictionary is used.
+        """
+        if dictionary_id is None:
+            return None
+
+        if dictionary_id not in archive.dictionaries:
+            result = await session.execute(
+                select(models.ArchiveDictionary.data).where(
+                    models.ArchiveDictionary.id == dictionary_id
+                )
+            )
+            archive.dictionaries[dictionary_id] = result.scalar_one()
+        return archive.dictionaries[dictionary_id]
+
+    async def _unpack_archive(
+        self, session: AsyncSession, chat_archive: models.ChatArchive
+    ) -> list[models.ChatMessage]:
+        """
+        Decompress the messages of a chat archive.
+
+        Args:
+            session (AsyncSession): The session to load the dictionary with.
+            chat_archive (models.ChatArchive): The archive.
+
+        Returns:
+            list[models.ChatMessage]: The archived messages, oldest first.
+        """
+        dictionary = await self._get_dictionary(session, chat_archive.dictionary_id)
+        data = archive.decompress(chat_archive.codec, chat_archive.data, dictionary)
+        return archive.unpack_messages(data, chat_archive.chat_id)
+
+    async def _restore_archived_messages(
+        self, session: AsyncSession, chat: models.Chat
+    ) -> None:
+        """
+        Prepend the archived messages of a chat to its loaded messages.
+
+        The messages are set as already persisted, so nothing is written back.
+
+        Args:
+            session (AsyncSession): The session the chat was loaded with.
+            chat (models.Chat): The chat, loaded with its messages and archive.
+        """
+        if chat.archive is None:
+            return
+
+        archived = await self._unpack_archive(session, chat.archive)
+        set_committed_value(chat, "messages", archived + list(chat.messages))
 
     async def create_chat(
         self, user: models.User, data: schemas.CreateChat
@@ -182,6 +362,9 @@ class AppService:
 
         async with self.session.begin():
             self.session.add(chat)
+
+        self.session.expunge(chat)
+        self.chat_cache.put(chat)
         return chat
 
     async def delete_chat(self, chat_id: int, user: models.User) -> None:
@@ -195,17 +378,393 @@ class AppService:
         Raises:
             HTTPException: If the chat is not found.
         """
+        deleted = await self.delete_chats(user, [chat_id])
+
+        if not deleted:
+            raise HTTPException(status_code=404, detail="Chat not found")
+
+    async def delete_chats(
+        self, user: models.User, chat_ids: list[int] | None = None
+    ) -> int:
+        """
+        Delete several chats of a user, or all of them.
+
+        Messages are removed by the database through the ON DELETE CASCADE
+        foreign key, so nothing is loaded into the session. With soft deletion
+        enabled, chats are only marked as deleted and purged later.
+
+        Args:
+            user (models.User): The user.
+            chat_ids (list[int] | None, optional): The IDs of the chats to delete.
+                Defaults to None, which deletes all chats of the user.
+
+        Returns:
+            int: The number of deleted chats.
+        """
+        condition = and_(
+            models.Chat.user_id == user.id, models.Chat.deleted_at.is_(None)
+        )
+        if chat_ids is not None:
+            condition = and_(condition, models.Chat.id.in_(chat_ids))
+
         async with self.session.begin():
-            chat = await self.session.scalar(
-                select(models.Chat)
-                .where(models.Chat.id == chat_id and models.Chat.user_id == user.id)
-                .options(selectinload(models.Chat.messages))
+            if settings.chats.soft_delete:
+                result = await self.session.execute(
+                    update(models.Chat).where(condition).values(deleted_at=func.now()),
+                    execution_options={"synchronize_session": False},
+                )
+            else:
+                result = await self.session.execute(
+                    delete(models.Chat).where(condition),
+                    execution_options={"synchronize_session": False},
+                )
+
+        if chat_ids is None:
+            self.chat_cache.invalidate_user(user.id)
+        else:
+            for chat_id in chat_ids:
+                self.chat_cache.invalidate(chat_id)
+        return result.rowcount
+
+    async def purge_deleted_chats(self, batch_size: int = 500) -> int:
+        """
+        Permanently delete soft-deleted chats.
+
+        Chats are deleted in batches, each in its own transaction, so that
+        purging a large backlog does not lock the database for long.
+
+        Args:
+            batch_size (int, optional): Chats deleted per transaction. Defaults to 500.
+
+        Returns:
+            int: The number of purged chats.
+        """
+        purged = 0
+        while True:
+            async with self.session.begin():
+                ids = (
+                    select(models.Chat.id)
+                    .where(models.Chat.deleted_at.is_not(None))
+                    .limit(batch_size)
+                    .scalar_subquery()
+                )
+                result = await self.session.execute(
+                    delete(models.Chat).where(models.Chat.id.in_(ids)),
+                    execution_options={"synchronize_session": False},
+                )
+
+            purged += result.rowcount
+            if result.rowcount < batch_size:
+                return purged
+
+    async def _get_or_train_dictionary(
+        self, codec: str, size: int
+    ) -> models.ArchiveDictionary | None:
+        """
+        Get the latest archive dictionary for a codec, training one from recent
+        messages if there is none yet.
+
+        Args:
+            codec (str): The codec, "zlib" or "zstd".
+            size (int): The maximum size of a new dictionary in bytes.
+
+        Returns:
+            models.ArchiveDictionary | None: The dictionary, or None if there
+                are not enough messages yet to train a useful one.
+        """
+        dictionary = await self.session.scalar(
+            select(models.ArchiveDictionary)
+            .where(models.ArchiveDictionary.codec == codec)
+            .order_by(models.ArchiveDictionary.id.desc())
+            .limit(1)
+        )
+        if dictionary is not None:
+            return dictionary
+
+        contents = (
+            await self.session.scalars(
+                select(models.ChatMessage.content)
+                .order_by(models.ChatMessage.id.desc())
+                .limit(1000)
             )
+        ).all()
+        samples = [content.encode() for content in reversed(contents)]
+        # A dictionary is kept forever, so do not settle for one trained on a
+        # handful of messages.
+        if sum(len(sample) for sample in samples) < size:
+            return None
+
+        dictionary = models.ArchiveDictionary(
+            codec=codec, data=archive.train_dictionary(codec, samples, size)
+        )
+        self.session.add(dictionary)
+        await self.session.flush()
+        return dictionary
+
+    async def archive_inactive_chats(
+        self,
+        inactive_for: timedelta,
+        codec: str = "zlib",
+        dictionary_size: int = 32768,
+        batch_size: int = 100,
+    ) -> int:
+        """
+        Move the messages of inactive chats to compressed archives.
 
-            if chat is None:
-                raise HTTPException(status_code=404, detail="Chat not found")
+        The messages of each chat are packed into one compressed blob, merged
+        with the chat's existing archive if any, and removed from the messages
+        table. Only the packed messages are removed, so a message added while a
+        chat is being archived stays live. Chats are archived in batches, each
+        in its own transaction.
 
-            await self.session.delete(chat)
+        Args:
+            inactive_for (timedelta): How long a chat must be inactive to be archived.
+            codec (str, optional): The codec, "zlib" or "zstd". Defaults to "zlib".
+            dictionary_size (int, optional): The maximum size of a newly trained
+                dictionary in bytes. Defaults to 32768.
+            batch_size (int, optional): Chats archived per transaction. Defaults to 100.
+
+        Returns:
+            int: The number of archived chats.
+        """
+        cutoff = datetime.now(UTC).replace(tzinfo=None) - inactive_for
+
+        archived = 0
+        while True:
+            async with self.session.begin():
+                chat_ids = (
+                    await self.session.scalars(
+                        select(models.ChatMessage.chat_id)
+                        .join(models.Chat)
+                        .where(models.Chat.deleted_at.is_(None))
+                        .group_by(models.ChatMessage.chat_id)
+                        .having(func.max(models.ChatMessage.create_date) < cutoff)
+                        .limit(batch_size)
+                    )
+                ).all()
+                if not chat_ids:
+                    return archived
+
+                dictionary = await self._get_or_train_dictionary(codec, dictionary_size)
+                dictionary_id = dictionary.id if dictionary else None
+                dictionary_data = dictionary.data if dictionary else None
+                if dictionary is not None:
+                    archive.dictionaries[dictionary.id] = dictionary.data
+
+                chats = await self.session.scalars(
+                    select(models.Chat)
+                    .where(models.Chat.id.in_(chat_ids))
+                    .options(
+                        selectinload(models.Chat.messages),
+                        joinedload(models.Chat.archive),
+                    )
+                )
+                message_ids: list[int] = []
+                for chat in chats.unique():
+                    messages = sorted(chat.messages, key=lambda message: message.id)
+                    message_ids.extend(message.id for message in messages)
+                    if chat.archive is not None:
+                        messages = (
+                            await self._unpack_archive(self.session, chat.archive)
+                            + messages
+                        )
+
+                    values = {
+                        "codec": codec,
+                        "dictionary_id": dictionary_id,
+                        "message_count": len(messages),
+                        "last_message_date": messages[-1].create_date,
+                        "data": archive.compress(
+                            codec, archive.pack_messages(messages), dictionary_data
+                        ),
+                    }
+                    if chat.archive is None:
+                        self.session.add(models.ChatArchive(chat_id=chat.id, **values))
+                    else:
+                        for key, value in values.items():
+                            setattr(chat.archive, key, value)
+
+                # Chunked to stay below the drivers' limits on bound parameters.
+                for start in range(0, len(message_ids), 1000):
+                    await self.session.execute(
+                        delete(models.ChatMessage).where(
+                            models.ChatMessage.id.in_(message_ids[start : start + 1000])
+                        ),
+                        execution_options={"synchronize_session": False},
+                    )
+
+            # Release the loaded chats and messages before the next batch.
+            self.session.expunge_all()
+            for chat_id in chat_ids:
+                self.chat_cache.invalidate(chat_id)
+            archived += len(chat_ids)
+            if len(chat_ids) < batch_size:
+                return archived
+
+    async def export_chats(
+        self, user: models.User, batch_size: int = 1000
+    ) -> AsyncGenerator[str, None]:
+        """
+        Export all chats of a user as NDJSON.
+
+        Rows are streamed from a server-side cursor, so memory stays constant
+        regardless of how many messages are exported.
+
+        Args:
+            user (models.User): The user.
+            batch_size (int, optional): Rows fetched per round trip. Defaults to 1000.
+
+        Yields:
+            str: One JSON line per chat, followed by one line per message.
+        """
+        async with self.session.begin():
+            result = await self.session.stream(
+                select(
+                    models.Chat.id,
+                    models.Chat.name,
+                    models.ChatArchive.chat_id.label("archived"),
+                    models.ChatMessage.kind,
+                    models.ChatMessage.content,
+                    models.ChatMessage.create_date,
+                )
+                .outerjoin(models.ChatArchive)
+                .outerjoin(
+                    models.ChatMessage, models.ChatMessage.chat_id == models.Chat.id
+                )
+                .where(models.Chat.user_id == user.id, models.Chat.deleted_at.is_(None))
+                .order_by(models.Chat.id, models.ChatMessage.id)
+                .execution_options(yield_per=batch_size)
+            )
+
+            chat_id = None
+            async for row in result:
+                if row.id != chat_id:
+                    chat_id = row.id
+                    chat = schemas.ExportedChat(id=row.id, name=row.name)
+                    yield chat.model_dump_json() + "\n"
+
+                    if row.archived is not None:
+                        chat_archive = await self.session.get_one(
+                            models.ChatArchive, row.id
+                        )
+                        self.session.expunge(chat_archive)
+                        for archived in await self._unpack_archive(
+                            self.session, chat_archive
+                        ):
+                            message = schemas.ExportedMessage(
+                                chat_id=row.id,
+                                kind=cast(schemas.MessageKind, archived.kind),
+                                content=archived.content,
+                                create_date=archived.create_date,
+                            )
+                            yield message.model_dump_json() + "\n"
+
+                if row.kind is None:
+                    continue
+
+                message = schemas.ExportedMessage(
+                    chat_id=row.id,
+                    kind=cast(schemas.MessageKind, row.kind),
+                    content=row.content,
+                    create_date=row.create_date,
+                )
+                yield message.model_dump_json() + "\n"
+
+    async def import_chats(
+        self, user: models.User, data: AsyncIterator[bytes], batch_size: int = 5000
+    ) -> schemas.ImportResult:
+        """
+        Import chats from an NDJSON export.
+
+        Chats and messages are buffered and written with batched multi-row
+        INSERTs, each batch committed in its own transaction so that a large
+        import does not hold a long write transaction. The batches committed
+        before an invalid line are kept, and the error reports how many chats
+        and messages they contain.
+
+        Args:
+            user (models.User): The user the chats are imported for.
+            data (AsyncIterator[bytes]): The NDJSON body, in arbitrary chunks.
+            batch_size (int, optional): Rows per INSERT batch. Defaults to 5000.
+
+        Returns:
+            schemas.ImportResult: The number of imported chats and messages.
+
+        Raises:
+            HTTPException: If a line is invalid or references an unknown chat.
+        """
+        chat_ids: dict[int, int] = {}
+        chats: list[schemas.ExportedChat] = []
+        messages: list[schemas.ExportedMessage] = []
+        result = schemas.ImportResult(chats=0, messages=0)
+
+        def rejected(reason: str) -> HTTPException:
+            return HTTPException(
+                status_code=400,
+                detail=f"{reason}, after importing {result.chats} chats "
+                f"and {result.messages} messages",
+            )
+
+        async def flush() -> None:
+            imported_chats, imported_messages = len(chats), len(messages)
+            async with self.session.begin():
+                await write_batch()
+            result.chats += imported_chats
+            result.messages += imported_messages
+
+        async def write_batch() -> None:
+            if chats:
+                ids = await self.session.scalars(
+                    insert(models.Chat).returning(
+                        models.Chat.id, sort_by_parameter_order=True
+                    ),
+                    [{"name": chat.name, "user_id": user.id} for chat in chats],
+                )
+                chat_ids.update(zip((chat.id for chat in chats), ids))
+                chats.clear()
+
+            if messages:
+                now = datetime.now(UTC).replace(tzinfo=None)
+                rows = []
+                for message in messages:
+                    if message.chat_id not in chat_ids:
+                        raise rejected(
+                            f"Message references unknown chat {message.chat_id}"
+                        )
+                    rows.append(
+                        {
+                            "chat_id": chat_ids[message.chat_id],
+                            "kind": message.kind,
+                            "content": message.content,
+                            "create_date": message.create_date or now,
+                        }
+                    )
+
+                await self.session.execute(insert(models.ChatMessage), rows)
+                messages.clear()
+
+        line_number = 0
+        async for line in _iter_lines(data):
+            line_number += 1
+            if not line.strip():
+                continue
+
+            try:
+                record = schemas.ExportRecord.validate_json(line)
+            except ValidationError:
+                raise rejected(f"Invalid record on line {line_number}")
+
+            if isinstance(record, schemas.ExportedChat):
+                chats.append(record)
+            else:
+                messages.append(record)
+
+            if len(chats) + len(messages) >= batch_size:
+                await flush()
+
+        await flush()
+
+        return result
 
     async def add_message(
         self, user: models.User, data: schemas.AddMessage, chat_id: int
@@ -225,78 +784,85 @@ class AppService:
             HTTPException: If the chat is not found.
         """
         async with self.session.begin():
-            chat = await self.session.scalar(
-                select(models.Chat).where(models.Chat.id == chat_id)
-            )
+            entry = await self._load_chat(self.session, chat_id)
 
-            if chat is None:
+            if entry is None or entry.chat.user_id != user.id:
                 raise HTTPException(status_code=404, detail="Chat not found")
 
             message = models.ChatMessage(
-                kind="human", content=data.message, chat_id=chat.id
+                kind="human", content=data.message, chat_id=chat_id
             )
 
             self.session.add(message)
+
+        self.session.expunge(message)
+        self.chat_cache.append(chat_id, message)
         return message
 
-    async def generate(self, chat_id: int) -> AsyncGenerator[dict, None]:
+    async def generate(
+        self, chat: models.Chat, ticket: Ticket | None = None
+    ) -> AsyncGenerator[dict, None]:
         """
         Generate a response for a chat.
 
+        When a scheduler ticket is given, the queue position is streamed until
+        a generation slot is granted, and the slot is released afterwards.
+        The database is only touched in a short unit of work after the
+        completion, so no connection is held while waiting on the LLM.
+        Frames are buffered per the SSE settings, so a slow or disconnected
+        client never stalls the completion.
+
         Args:
-            chat_id (int): The ID of the chat.
+            chat (models.Chat): The chat, loaded with its messages and owned by
+                the user.
+            ticket (Ticket | None, optional): The scheduler ticket. Defaults to None.
 
         Yields:
             dict: A dictionary containing the generated response.
-
-        Raises:
-            HTTPException: If the chat is not found.
         """
-        async with self.session.begin():
-            chat = await self.session.scalar(
-                select(models.Chat)
-                .where(models.Chat.id == chat_id)
-                .options(
-                    selectinload(models.Chat.messages),
-                )
-            )
-
-        if chat is None:
-            raise HTTPException(status_code=404, detail="Chat not found")
-
-        messages: list[dict] = []
-
-        for message in chat.messages:
-            if message.kind == "human":
-                messages.append({"role": "user", "content": message.content})
-            else:
-                messages.append({"role": "assistant", "content": message.content})
-
-        response = await litellm.acompletion(
-            model="gpt-3.5-turbo", messages=messages, stream=True
+        frames = buffered(
+            self._generate(chat),
+            maxsize=settings.sse.max_buffered_frames,
+            on_disconnect=settings.sse.on_disconnect,
+            on_done=ticket.release if ticket is not None else None,
         )
 
+        if ticket is not None:
+            async with aclosing(ticket.wait()) as positions:
+                async for position in positions:
+                    s = f"""
+                    <div id="ai-sse" class="prose prose-sm w-full flex flex-col [&>*]:flex-grow">
+                        <p>Waiting in queue (position {position})…</p>
+                    </div>
+                    """
+                    yield {"event": "message", "id": "id", "data": s}
+
+        async with aclosing(frames):
+            async for event in frames:
+                yield event
+
+    async def _generate(self, chat: models.Chat) -> AsyncGenerator[dict, None]:
         res = ""
-        async for chunk in response:
-            content = chunk.choices[0].delta.content
-            if content:
-                res += content
-                s = f"""
-                <div id="ai-sse" class="prose prose-sm w-full flex flex-col [&>*]:flex-grow">
-                    {markdown(res, extensions=["fenced_code"])}
-                </div>
-                """
-                yield {"event": "message", "id": "id", "data": s}
-
-        async with self.session.begin():
+        async for content in llm.stream_completion(self.chat_cache.prompt(chat)):
+            res += content
+            s = f"""
+            <div id="ai-sse" class="prose prose-sm w-full flex flex-col [&>*]:flex-grow">
+                {markdown(res, extensions=["fenced_code"])}
+            </div>
+            """
+            yield {"event": "message", "id": "id", "data": s}
+
+        async with self.unit_of_work() as session:
             gen_message = models.ChatMessage(
                 kind="assistant", content=res, chat_id=chat.id
             )
-            self.session.add(gen_message)
+            session.add(gen_message)
+
+        self.chat_cache.append(chat.id, gen_message)
 
         s = f"""
         <div class="prose prose-sm w-full flex flex-col [&>*]:flex-grow">
-            {markdown(res, extensions=["fenced_code"])}
+            {await renderer.render(res)}
         </div>
 
         <div id="stream" hx-swap-oob="true" hx-swap="outerHTML"></div>
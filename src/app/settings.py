@@ -1,3 +1,5 @@
+from typing import Literal
+
 from dotenv import load_dotenv
 from pydantic import (
     Field,
@@ -8,11 +10,115 @@ load_dotenv()
 
 
 class Database(BaseSettings):
+    backend: Literal["sqlite", "postgres"] = Field(alias="DB_BACKEND", default="sqlite")
+
+    # SQLite
     path: str = Field(alias="DB_PATH", default="localhost")
 
+    # PostgreSQL
+    host: str = Field(alias="DB_HOST", default="localhost")
+    port: int = Field(alias="DB_PORT", default=5432)
+    user: str = Field(alias="DB_USER", default="postgres")
+    password: str = Field(alias="DB_PASSWORD", default="postgres")
+    name: str = Field(alias="DB_NAME", default="app")
+    pool_size: int = Field(alias="DB_POOL_SIZE", default=10)
+    max_overflow: int = Field(alias="DB_MAX_OVERFLOW", default=20)
+    pool_timeout: float = Field(alias="DB_POOL_TIMEOUT", default=30.0)
+    statement_cache_size: int = Field(alias="DB_STATEMENT_CACHE_SIZE", default=500)
+
+
+class Generation(BaseSettings):
+    max_concurrency: int = Field(alias="GENERATE_MAX_CONCURRENCY", default=64)
+    max_per_user: int = Field(alias="GENERATE_MAX_PER_USER", default=2)
+    rate: float = Field(alias="GENERATE_RATE", default=0.5)
+    burst: int = Field(alias="GENERATE_BURST", default=5)
+    max_queue: int = Field(alias="GENERATE_MAX_QUEUE", default=512)
+
+
+class LLM(BaseSettings):
+    model: str = Field(alias="LLM_MODEL", default="gpt-3.5-turbo")
+    hedge_delay: float | None = Field(alias="LLM_HEDGE_DELAY", default=None)
+    hedge_model: str | None = Field(alias="LLM_HEDGE_MODEL", default=None)
+
+    # HTTP client shared by all LLM calls
+    base_url: str | None = Field(alias="LLM_BASE_URL", default=None)
+    timeout: float = Field(alias="LLM_TIMEOUT", default=600.0)
+    max_connections: int = Field(alias="LLM_MAX_CONNECTIONS", default=100)
+    max_keepalive_connections: int = Field(
+        alias="LLM_MAX_KEEPALIVE_CONNECTIONS", default=20
+    )
+    keepalive_expiry: float = Field(alias="LLM_KEEPALIVE_EXPIRY", default=60.0)
+    http2: bool = Field(alias="LLM_HTTP2", default=False)
+    warmup_connections: int = Field(alias="LLM_WARMUP_CONNECTIONS", default=2)
+
+
+class SSE(BaseSettings):
+    ping_interval: int = Field(alias="SSE_PING_INTERVAL", default=15)
+    send_timeout: float = Field(alias="SSE_SEND_TIMEOUT", default=30.0)
+    max_buffered_frames: int = Field(alias="SSE_MAX_BUFFERED_FRAMES", default=4)
+    on_disconnect: Literal["cancel", "detach"] = Field(
+        alias="SSE_ON_DISCONNECT", default="detach"
+    )
+
+
+class Chats(BaseSettings):
+    soft_delete: bool = Field(alias="CHAT_SOFT_DELETE", default=False)
+    purge_interval: float = Field(alias="CHAT_PURGE_INTERVAL", default=60.0)
+    purge_batch_size: int = Field(alias="CHAT_PURGE_BATCH_SIZE", default=500)
+
+    # In-process cache of recently active chats, 0 disables it. Defaults to
+    # 1024 with SQLite and to disabled with PostgreSQL, see get_cache_size.
+    cache_size: int | None = Field(alias="CHAT_CACHE_SIZE", default=None)
+    cache_max_bytes: int = Field(alias="CHAT_CACHE_MAX_BYTES", default=64 * 1024 * 1024)
+
+
+class Archive(BaseSettings):
+    after_days: float | None = Field(alias="ARCHIVE_AFTER_DAYS", default=None)
+    codec: Literal["zlib", "zstd"] = Field(alias="ARCHIVE_CODEC", default="zlib")
+    dictionary_size: int = Field(alias="ARCHIVE_DICTIONARY_SIZE", default=32768)
+    interval: float = Field(alias="ARCHIVE_INTERVAL", default=3600.0)
+    batch_size: int = Field(alias="ARCHIVE_BATCH_SIZE", default=100)
+
+
+class Rendering(BaseSettings):
+    # Messages up to this many characters are rendered on the event loop
+    inline_max_size: int = Field(alias="RENDER_INLINE_MAX_SIZE", default=16 * 1024)
+    # Larger messages are shown as plaintext instead of markdown
+    max_size: int = Field(alias="RENDER_MAX_SIZE", default=1024 * 1024)
+    timeout: float = Field(alias="RENDER_TIMEOUT", default=2.0)
+    workers: int = Field(alias="RENDER_WORKERS", default=2)
+    cache_max_bytes: int = Field(
+        alias="RENDER_CACHE_MAX_BYTES", default=32 * 1024 * 1024
+    )
+
+
+class Debug(BaseSettings):
+    query_stats: bool = Field(alias="DEBUG_QUERY_STATS", default=False)
+    # Raise instead of logging a warning when a route exceeds its query budget,
+    # meant for tests
+    enforce_query_budgets: bool = Field(
+        alias="DEBUG_ENFORCE_QUERY_BUDGETS", default=False
+    )
+
+    # Profiling, requires the "profiling" extra
+    profile_token: str | None = Field(alias="PROFILE_TOKEN", default=None)
+    profile_sample_rate: float = Field(alias="PROFILE_SAMPLE_RATE", default=0.0)
+    profile_interval: float = Field(alias="PROFILE_INTERVAL", default=0.001)
+    profile_dir: str = Field(alias="PROFILE_DIR", default=".volumes/profiles")
+
+    loop_lag_threshold: float | None = Field(alias="LOOP_LAG_THRESHOLD", default=None)
+    loop_lag_interval: float = Field(alias="LOOP_LAG_INTERVAL", default=0.05)
+
 
 class Settings(BaseSettings):
     database: Database = Database()
+    generation: Generation = Generation()
+    chats: Chats = Chats()
+    llm: LLM = LLM()
+    sse: SSE = SSE()
+    archive: Archive = Archive()
+    rendering: Rendering = Rendering()
+    debug: Debug = Debug()
 
 
 settings = Settings()
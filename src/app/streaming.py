@@ -0,0 +1,121 @@
+import asyncio
+from collections import deque
+from contextlib import suppress
+from dataclasses import dataclass, field
+from typing import AsyncGenerator, Callable, Literal
+
+from app.metrics import metrics
+
+# Strong references to producers left running after their client disconnected,
+# as the event loop only keeps weak references to tasks.
+detached_producers: set[asyncio.Task] = set()
+
+
+@dataclass
+class FrameBuffer:
+    """
+    Bounded buffer of outgoing SSE frames.
+
+    Every frame of a generation replaces the previous one on the client, so
+    when a slow client lets the buffer fill up the oldest frames are dropped
+    instead of accumulating in memory.
+    """
+
+    maxsize: int
+    frames: deque[dict] = field(default_factory=deque)
+    closed: bool = False
+    error: BaseException | None = None
+    _ready: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def put(self, frame: dict) -> None:
+        """
+        Add a frame, dropping the oldest one if the buffer is full.
+
+        Args:
+            frame (dict): The SSE frame.
+        """
+        if len(self.frames) >= self.maxsize:
+            self.frames.popleft()
+            metrics.inc("sse_frames_dropped_total")
+        self.frames.append(frame)
+        self._ready.set()
+
+    def close(self, error: BaseException | None = None) -> None:
+        """
+        Mark the end of the frames.
+
+        Args:
+            error (BaseException | None, optional): The error that ended the
+                frames, re-raised to the reader. Defaults to None.
+        """
+        self.closed = True
+        self.error = error
+        self._ready.set()
+
+    async def __aiter__(self) -> AsyncGenerator[dict, None]:
+        while True:
+            while self.frames:
+                yield self.frames.popleft()
+
+            if self.closed:
+                if self.error is not None:
+                    raise self.error
+                return
+
+            self._ready.clear()
+            await self._ready.wait()
+
+
+async def buffered(
+    frames: AsyncGenerator[dict, None],
+    maxsize: int,
+    on_disconnect: Literal["cancel", "detach"],
+    on_done: Callable[[], None] | None = None,
+) -> AsyncGenerator[dict, None]:
+    """
+    Decouple producing frames from sending them to the client.
+
+    The frames are produced by a background task into a FrameBuffer, so a slow
+    client never stalls the upstream stream. When the client goes away, the
+    producer is either cancelled or detached and left to run to completion.
+
+    Args:
+        frames (AsyncGenerator[dict, None]): The frames to send.
+        maxsize (int): The maximum number of buffered frames.
+        on_disconnect (Literal["cancel", "detach"]): What to do with the
+            producer when the client disconnects.
+        on_done (Callable[[], None] | None, optional): Called once the producer
+            has finished, was cancelled or failed. Defaults to None.
+
+    Yields:
+        dict: The frames, minus those dropped for slow clients.
+    """
+    buffer = FrameBuffer(maxsize)
+
+    async def produce() -> None:
+        try:
+            async for frame in frames:
+                buffer.put(frame)
+        except Exception as e:
+            buffer.close(e)
+        else:
+            buffer.close()
+
+    producer = asyncio.create_task(produce())
+    if on_done is not None:
+        producer.add_done_callback(lambda _: on_done())
+
+    try:
+        async for frame in buffer:
+            yield frame
+    finally:
+        if not producer.done():
+            if on_disconnect == "detach":
+                metrics.inc("sse_detached_total")
+                detached_producers.add(producer)
+                producer.add_done_callback(detached_producers.discard)
+            else:
+                metrics.inc("sse_cancelled_total")
+                producer.cancel()
+                with suppress(asyncio.CancelledError):
+                    await producer
@@ -1,15 +1,25 @@
-from typing import Annotated, AsyncGenerator
+from functools import cache
+from typing import Annotated, AsyncGenerator, Awaitable, Callable
 
 from fastapi import Depends, HTTPException, Request
 from fastapi.security import HTTPBearer
 from fastapi.templating import Jinja2Templates
 
-from app.db import AsyncSession, async_session, models
+from app.db import AsyncSession, async_session, models, query_stats
 from app.service import AppService
 
 security = HTTPBearer()
 
-templates = Jinja2Templates(directory="templates")
+
+@cache
+def get_templates() -> Jinja2Templates:
+    """
+    Get the Jinja2 template environment, creating it on first use.
+
+    Returns:
+        Jinja2Templates: The template environment.
+    """
+    return Jinja2Templates(directory="templates")
 
 
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
@@ -61,9 +71,32 @@ async def get_user(
         raise HTTPException(status_code=401, detail="Not authenticated")
 
     user = await app_service.get_user_by_id(int(cookie))
-    print(user)
 
     if user is None:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
     yield user
+
+
+def query_budget(limit: int) -> Callable[[], Awaitable[None]]:
+    """
+    Build a route dependency that declares a maximum number of queries.
+
+    The budget covers the whole request, including the body of streaming
+    responses. It is checked by the query stats middleware, i.e. when
+    DEBUG_QUERY_STATS is enabled. Exceeding it logs a warning, or raises with
+    DEBUG_ENFORCE_QUERY_BUDGETS, which makes redundant queries fail tests.
+
+    Args:
+        limit (int): The maximum number of queries the route may run.
+
+    Returns:
+        A dependency to add to the route's dependencies.
+    """
+
+    async def set_query_budget() -> None:
+        stats = query_stats.get()
+        if stats is not None:
+            stats.budget = limit
+
+    return set_query_budget
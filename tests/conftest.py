@@ -0,0 +1,191 @@
+import asyncio
+import os
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import AsyncGenerator, AsyncIterator, Callable, Iterator
+
+import pytest
+from fastapi.testclient import TestClient
+from sse_starlette.sse import AppStatus
+
+from app import db, llm, middleware
+from app.app import create_app
+from app.cache import ChatCache, get_cache_size
+from app.db import (
+    AsyncSession,
+    QueryStats,
+    async_session,
+    dispose_engine,
+    get_engine,
+    init_models,
+)
+from app.db.models import Base
+from app.metrics import Summary, metrics
+from app.rendering import renderer
+from app.scheduler import scheduler
+from app.service import AppService
+from app.settings import settings
+
+ROOT = Path(__file__).parent.parent
+
+# Tests against PostgreSQL run in this database, which is wiped by every test.
+TEST_DB_NAME = os.environ.get("TEST_DB_NAME", "app_test")
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    parser.addoption(
+        "--postgres",
+        action="store_true",
+        default=bool(os.environ.get("TEST_POSTGRES")),
+        help="Also run the database tests against the PostgreSQL server configured "
+        "in the environment. They fail if it is unavailable. Defaults to whether "
+        "TEST_POSTGRES is set.",
+    )
+
+
+async def reset_database() -> None:
+    """
+    Recreate all tables, then release the engine so that the test's event loop
+    opens its own connections.
+    """
+    async with get_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await init_models()
+    await dispose_engine()
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.fixture
+def fresh_metrics(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Start the test with empty metrics.
+    """
+    monkeypatch.setattr(metrics, "counters", defaultdict(float))
+    monkeypatch.setattr(metrics, "gauges", {})
+    monkeypatch.setattr(metrics, "summaries", defaultdict(Summary))
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def backend(
+    request: pytest.FixtureRequest,
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: Path,
+    fresh_metrics: None,
+) -> Iterator[str]:
+    """
+    Point the application at an empty database of each backend, and reset the
+    in-process state shared between requests.
+    """
+    backend: str = request.param
+    if backend == "postgres":
+        if not request.config.getoption("--postgres"):
+            pytest.skip("PostgreSQL tests run with --postgres")
+        monkeypatch.setattr(settings.database, "name", TEST_DB_NAME)
+    else:
+        monkeypatch.setattr(settings.database, "path", str(tmp_path / "test.db"))
+    monkeypatch.setattr(settings.database, "backend", backend)
+
+    monkeypatch.setattr(settings.llm, "warmup_connections", 0)
+    monkeypatch.setattr(renderer, "workers", 1)
+    monkeypatch.setattr(renderer, "_cache", OrderedDict())
+    monkeypatch.setattr(renderer, "_cache_bytes", 0)
+    monkeypatch.setattr(scheduler, "buckets", {})
+    monkeypatch.setattr(
+        AppService,
+        "chat_cache",
+        ChatCache(
+            max_entries=get_cache_size(),
+            max_bytes=settings.chats.cache_max_bytes,
+        ),
+    )
+
+    asyncio.run(reset_database())
+    yield backend
+    asyncio.run(dispose_engine())
+
+
+@pytest.fixture
+async def session(backend: str) -> AsyncIterator[AsyncSession]:
+    """
+    A session for tests calling the service directly, on the test's event loop.
+    """
+    async with async_session() as session:
+        yield session
+    await dispose_engine()
+
+
+@pytest.fixture
+def query_stats(backend: str, monkeypatch: pytest.MonkeyPatch) -> list[QueryStats]:
+    """
+    Enable query stats and enforce the routes' query budgets. Request it before
+    `client`, as the middleware is added when the app is created.
+
+    Returns:
+        list[QueryStats]: The stats of each request, covering its whole response.
+    """
+    monkeypatch.setattr(settings.debug, "query_stats", True)
+    monkeypatch.setattr(settings.debug, "enforce_query_budgets", True)
+    requests = []
+
+    @contextmanager
+    def track_queries() -> Iterator[QueryStats]:
+        with db.track_queries() as stats:
+            requests.append(stats)
+            yield stats
+
+    monkeypatch.setattr(middleware, "track_queries", track_queries)
+    return requests
+
+
+@pytest.fixture
+def fake_llm(monkeypatch: pytest.MonkeyPatch) -> list[list[dict]]:
+    """
+    Replace the LLM with one answering "Hello world".
+
+    Returns:
+        list[list[dict]]: The prompts sent to the LLM.
+    """
+    prompts = []
+
+    async def stream_completion(
+        messages: list[dict], model: str | None = None
+    ) -> AsyncGenerator[str, None]:
+        prompts.append(messages)
+        yield "Hello"
+        yield " world"
+
+    monkeypatch.setattr(llm, "stream_completion", stream_completion)
+    return prompts
+
+
+@pytest.fixture
+def client(backend: str, monkeypatch: pytest.MonkeyPatch) -> Iterator[TestClient]:
+    """
+    A client of the application, running its lifespan.
+    """
+    monkeypatch.chdir(ROOT)
+    # sse_starlette creates this event on the first stream and keeps it, but
+    # each client runs the application on a new event loop.
+    monkeypatch.setattr(AppStatus, "should_exit_event", None)
+    with TestClient(create_app()) as client:
+        yield client
+
+
+@pytest.fixture
+def login(client: TestClient) -> Callable[[str], None]:
+    """
+    Sign a user up and log the client in as them.
+    """
+
+    def login(username: str) -> None:
+        credentials = {"username": username, "password": "password"}
+        client.post("/auth/signup", json=credentials)
+        response = client.post("/auth/login", json=credentials)
+        assert response.status_code == 200
+
+    return login
@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from app import schemas
+from app.db import AsyncSession, async_session, models
+from app.service import AppService
+
+LONG_AGO = datetime(2000, 1, 1)
+
+
+async def add_old_message(chat_id: int, content: str) -> None:
+    async with async_session() as session, session.begin():
+        session.add(
+            models.ChatMessage(
+                chat_id=chat_id, kind="human", content=content, create_date=LONG_AGO
+            )
+        )
+
+
+@pytest.mark.anyio
+async def test_archive_keeps_messages_added_while_archiving(
+    session: AsyncSession, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    app_service = AppService(session)
+    user = await app_service.create_user(
+        schemas.Signup(username="alice", password="password")
+    )
+    chat = await app_service.create_chat(user, schemas.CreateChat(message="first"))
+    async with session.begin():
+        await session.execute(update(models.ChatMessage).values(create_date=LONG_AGO))
+
+    assert await app_service.archive_inactive_chats(timedelta(days=1)) == 1
+    await add_old_message(chat.id, "second")
+
+    unpack_archive = AppService._unpack_archive
+
+    async def unpack_archive_racing_a_write(
+        self: AppService, session: AsyncSession, chat_archive: models.ChatArchive
+    ) -> list[models.ChatMessage]:
+        # The chat's live messages are loaded by now, so this one is not packed.
+        await add_old_message(chat.id, "third")
+        return await unpack_archive(self, session, chat_archive)
+
+    monkeypatch.setattr(AppService, "_unpack_archive", unpack_archive_racing_a_write)
+    assert await app_service.archive_inactive_chats(timedelta(days=1)) == 1
+    monkeypatch.setattr(AppService, "_unpack_archive", unpack_archive)
+
+    restored = await app_service.get_chat_by_id(chat.id, user)
+    assert restored is not None
+    assert [message.content for message in restored.messages] == [
+        "first",
+        "second",
+        "third",
+    ]
@@ -0,0 +1,63 @@
+from typing import Callable
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.cache import ChatCache, get_cache_size
+from app.scheduler import scheduler
+from app.service import AppService
+from app.settings import settings
+
+
+@pytest.mark.parametrize(
+    ("backend", "cache_size", "expected"),
+    [
+        ("sqlite", None, 1024),
+        ("postgres", None, 0),
+        ("postgres", 100, 100),
+        ("sqlite", 0, 0),
+    ],
+)
+def test_cache_size(
+    monkeypatch: pytest.MonkeyPatch,
+    backend: str,
+    cache_size: int | None,
+    expected: int,
+) -> None:
+    monkeypatch.setattr(settings.database, "backend", backend)
+    monkeypatch.setattr(settings.chats, "cache_size", cache_size)
+
+    assert get_cache_size() == expected
+
+
+@pytest.mark.parametrize("cache_size", [0, 1024])
+def test_generate_checks_owner(
+    client: TestClient,
+    login: Callable[[str], None],
+    fake_llm: list[list[dict]],
+    monkeypatch: pytest.MonkeyPatch,
+    cache_size: int,
+) -> None:
+    cache = ChatCache(max_entries=cache_size, max_bytes=1024 * 1024)
+    monkeypatch.setattr(AppService, "chat_cache", cache)
+    login("alice")
+    client.post("/chat/", json={"message": "Hello"})
+
+    login("bob")
+    response = client.get("/chat/generate/1")
+
+    assert response.status_code == 404
+    assert not fake_llm
+    # The request was rejected before spending a rate limit token.
+    assert 2 not in scheduler.buckets
+    cached = cache.get(1)
+    if cache_size:
+        assert cached is not None
+        assert [message.content for message in cached.chat.messages] == ["Hello"]
+    else:
+        assert cached is None
+
+    credentials = {"username": "alice", "password": "password"}
+    client.post("/auth/login", json=credentials)
+    assert client.get("/chat/generate/1").status_code == 200
+    assert fake_llm == [[{"role": "user", "content": "Hello"}]]
@@ -0,0 +1,124 @@
+import asyncio
+import time
+from typing import AsyncGenerator, Callable
+
+import pytest
+
+from app.llm import hedged_stream
+from app.metrics import metrics
+
+pytestmark = [pytest.mark.anyio, pytest.mark.usefixtures("fresh_metrics")]
+
+
+class FakeStream:
+    """
+    A fake completion stream, recording whether it was started and closed.
+    """
+
+    def __init__(
+        self, items: list[str], delay: float = 0.0, error: Exception | None = None
+    ) -> None:
+        self.items = items
+        self.delay = delay
+        self.error = error
+        self.started = False
+        self.closed = False
+
+    def __call__(self) -> AsyncGenerator[str, None]:
+        self.started = True
+        return self.stream()
+
+    async def stream(self) -> AsyncGenerator[str, None]:
+        try:
+            await asyncio.sleep(self.delay)
+            if self.error is not None:
+                raise self.error
+            for item in self.items:
+                yield item
+        finally:
+            self.closed = True
+
+
+async def collect(
+    primary: Callable[[], AsyncGenerator[str, None]],
+    backup: Callable[[], AsyncGenerator[str, None]],
+    delay: float,
+) -> list[str]:
+    return [item async for item in await hedged_stream(primary, backup, delay)]
+
+
+async def test_fast_primary() -> None:
+    primary, backup = FakeStream(["a", "b"]), FakeStream(["x"])
+
+    assert await collect(primary, backup, delay=1.0) == ["a", "b"]
+
+    assert not backup.started
+    assert "llm_hedged_total" not in metrics.counters
+    assert metrics.summaries["llm_time_to_first_token_seconds"].count == 1
+
+
+async def test_slow_primary_fast_backup() -> None:
+    primary, backup = FakeStream(["a"], delay=10.0), FakeStream(["x", "y"])
+
+    assert await collect(primary, backup, delay=0.01) == ["x", "y"]
+
+    assert primary.closed
+    assert metrics.counters["llm_hedged_total"] == 1
+    assert metrics.counters["llm_hedge_wins_total"] == 1
+
+
+async def test_early_primary_failure() -> None:
+    primary = FakeStream([], error=RuntimeError("primary"))
+    backup = FakeStream(["x"])
+
+    start = time.perf_counter()
+    assert await collect(primary, backup, delay=10.0) == ["x"]
+
+    # The backup is started as soon as the primary fails, not after the delay.
+    assert time.perf_counter() - start < 5.0
+    assert metrics.counters["llm_hedge_wins_total"] == 1
+
+
+async def test_both_failing() -> None:
+    primary = FakeStream([], error=RuntimeError("primary"))
+    backup = FakeStream([], error=RuntimeError("backup"))
+
+    with pytest.raises(RuntimeError, match="primary"):
+        await collect(primary, backup, delay=0.01)
+
+    assert primary.closed and backup.closed
+    assert metrics.counters["llm_errors_total"] == 1
+
+
+async def test_both_failing_together() -> None:
+    release = asyncio.Event()
+
+    async def failing(name: str) -> AsyncGenerator[str, None]:
+        await release.wait()
+        raise RuntimeError(name)
+        yield
+
+    # Both streams fail in the same loop iteration, after the backup started.
+    asyncio.get_running_loop().call_later(0.05, release.set)
+
+    with pytest.raises(RuntimeError, match="primary"):
+        await collect(lambda: failing("primary"), lambda: failing("backup"), 0.01)
+
+
+async def test_empty_primary() -> None:
+    primary, backup = FakeStream([]), FakeStream(["x"])
+
+    assert await collect(primary, backup, delay=10.0) == ["x"]
+
+    # Only the backup's first token is observed, the empty primary is not.
+    assert metrics.counters["llm_hedge_wins_total"] == 1
+    assert metrics.summaries["llm_time_to_first_token_seconds"].count == 1
+
+
+async def test_both_empty() -> None:
+    primary, backup = FakeStream([]), FakeStream([])
+
+    assert await collect(primary, backup, delay=0.01) == []
+
+    assert "llm_time_to_first_token_seconds" not in metrics.summaries
+    assert "llm_errors_total" not in metrics.counters
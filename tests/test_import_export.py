@@ -0,0 +1,66 @@
+import json
+from typing import Callable
+
+from fastapi.testclient import TestClient
+
+
+def ndjson(*records: dict) -> bytes:
+    return "\n".join(json.dumps(record) for record in records).encode()
+
+
+def test_export_import_roundtrip(
+    client: TestClient, login: Callable[[str], None]
+) -> None:
+    login("alice")
+    client.post("/chat/", json={"message": "Hello"})
+    client.post("/chat/1/add-message", json={"message": "Again"})
+
+    export = client.get("/chat/export").content
+    records = [json.loads(line) for line in export.splitlines()]
+    assert [record["type"] for record in records] == ["chat", "message", "message"]
+
+    login("bob")
+    response = client.post("/chat/import", content=export)
+    assert response.json() == {"chats": 1, "messages": 2}
+    assert client.get("/chat/export").content.count(b'"content":"Again"') == 1
+
+
+def test_import_rejects_unknown_kind(
+    client: TestClient, login: Callable[[str], None]
+) -> None:
+    login("alice")
+
+    response = client.post(
+        "/chat/import",
+        content=ndjson(
+            {"type": "chat", "id": 1, "name": "Chat"},
+            {"type": "message", "chat_id": 1, "kind": "system", "content": "Hi"},
+        ),
+    )
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == (
+        "Invalid record on line 2, after importing 0 chats and 0 messages"
+    )
+
+
+def test_import_commits_each_batch(
+    client: TestClient, login: Callable[[str], None]
+) -> None:
+    login("alice")
+    records = [{"type": "chat", "id": i, "name": f"Chat {i}"} for i in range(6000)]
+    records.append(
+        {"type": "message", "chat_id": 12345, "kind": "human", "content": ""}
+    )
+
+    response = client.post("/chat/import", content=ndjson(*records))
+
+    assert response.status_code == 400
+    # The first batch of 5000 rows was committed before the invalid message,
+    # and the error says so, while the batch with the message was rolled back.
+    assert response.json()["detail"] == (
+        "Message references unknown chat 12345, "
+        "after importing 5000 chats and 0 messages"
+    )
+    exported = client.get("/chat/export").content.splitlines()
+    assert len(exported) == 5000
@@ -0,0 +1,36 @@
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+# Cumulative import time of the application module, in seconds.
+IMPORT_TIME_BUDGET = float(os.environ.get("IMPORT_TIME_BUDGET", "2.0"))
+
+
+def test_import_time() -> None:
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            "import sys, app.app; print(sorted(sys.modules))",
+        ],
+        cwd=ROOT,
+        env={**os.environ, "PYTHONPATH": str(ROOT / "src")},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert "'litellm'" not in result.stdout, "litellm must be imported lazily"
+
+    # Lines look like "import time: <self us> | <cumulative us> | <module>".
+    match = re.search(r"^import time: +\d+ \| +(\d+) \| app\.app$", result.stderr, re.M)
+    assert match is not None
+    elapsed = int(match.group(1)) / 1_000_000
+    message = f"importing app.app took {elapsed:.2f}s, budget is {IMPORT_TIME_BUDGET}s"
+    assert elapsed < IMPORT_TIME_BUDGET, message
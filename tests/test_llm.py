@@ -0,0 +1,128 @@
+import asyncio
+import json
+import time
+from typing import AsyncGenerator, AsyncIterator
+
+import pytest
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from app import llm
+from app.metrics import metrics
+from app.settings import settings
+
+# A local OpenAI-compatible provider, answering every completion with "Hello world".
+upstream = FastAPI()
+
+
+@upstream.head("/v1")
+async def root() -> None:
+    pass
+
+
+@upstream.post("/v1/chat/completions")
+async def chat_completions() -> StreamingResponse:
+    def chunk(delta: dict, finish_reason: str | None = None) -> str:
+        data = {
+            "id": "chatcmpl-test",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": "gpt-3.5-turbo",
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(data)}\n\n"
+
+    async def events() -> AsyncGenerator[str, None]:
+        yield chunk({"role": "assistant", "content": "Hello"})
+        yield chunk({"content": " world"})
+        yield chunk({}, finish_reason="stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@pytest.fixture
+async def upstream_url() -> AsyncIterator[str]:
+    """
+    Serve the local provider on a free port.
+
+    Returns:
+        str: The provider's base URL.
+    """
+    config = uvicorn.Config(upstream, host="127.0.0.1", port=0, log_level="warning")
+    server = uvicorn.Server(config)
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    port = server.servers[0].sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}/v1"
+
+    server.should_exit = True
+    await task
+
+
+@pytest.fixture
+def unreachable_provider(monkeypatch: pytest.MonkeyPatch) -> float:
+    """
+    Make warming up the LLM connections hang, like a blackholed provider.
+    Request it before `client`, which starts the app.
+
+    Returns:
+        float: When the provider became unreachable, from time.perf_counter.
+    """
+
+    async def warm_up() -> None:
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(llm, "warm_up", warm_up)
+    return time.perf_counter()
+
+
+@pytest.mark.anyio
+async def test_litellm_uses_shared_client() -> None:
+    litellm = await llm.load_litellm()
+    client = llm.get_http_client()
+    assert litellm.aclient_session is client
+
+    await llm.close()
+
+    assert litellm.aclient_session is None
+    assert client.is_closed
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("fresh_metrics")
+async def test_connections_are_reused(
+    monkeypatch: pytest.MonkeyPatch, upstream_url: str
+) -> None:
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(settings.llm, "base_url", upstream_url)
+    monkeypatch.setattr(settings.llm, "warmup_connections", 2)
+    messages = [{"role": "user", "content": "Hello"}]
+
+    async def complete() -> str:
+        return "".join([content async for content in llm.stream_completion(messages)])
+
+    try:
+        await llm.warm_up()
+        assert metrics.counters["llm_http_connections_opened_total"] == 2
+
+        for _ in range(3):
+            results = await asyncio.gather(complete(), complete())
+            assert results == ["Hello world", "Hello world"]
+    finally:
+        await llm.close()
+
+    # Every completion went through one of the warmed-up connections.
+    assert metrics.counters["llm_http_requests_total"] == 8
+    assert metrics.counters["llm_http_connections_opened_total"] == 2
+
+
+def test_startup_does_not_wait_for_warm_up(
+    unreachable_provider: float, client: TestClient
+) -> None:
+    assert client.get("/login").status_code == 200
+    assert time.perf_counter() - unreachable_provider < 5
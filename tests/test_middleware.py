@@ -0,0 +1,78 @@
+from pathlib import Path
+
+import pytest
+from starlette.types import Message, Receive, Scope, Send
+
+from app.db import query_stats
+from app.middleware import ProfilingMiddleware, QueryStatsMiddleware
+from app.settings import settings
+
+
+async def app(scope: Scope, receive: Receive, send: Send) -> None:
+    pass
+
+
+async def over_budget_app(scope: Scope, receive: Receive, send: Send) -> None:
+    stats = query_stats.get()
+    assert stats is not None
+    stats.budget = 0
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    # Queries run while the body is streamed count towards the budget.
+    stats.queries += 1
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def receive() -> Message:
+    return {"type": "http.disconnect"}
+
+
+async def send(message: Message) -> None:
+    pass
+
+
+def scope(profile_header: bytes) -> Scope:
+    return {"type": "http", "headers": [(b"x-profile", profile_header)]}
+
+
+@pytest.mark.parametrize(
+    ("token", "header", "expected"),
+    [
+        ("secret", b"secret", True),
+        ("secret", b"wrong", False),
+        ("secret", "sécret".encode(), False),
+        ("sécret", "sécret".encode(), True),
+    ],
+)
+def test_profile_token(
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: Path,
+    token: str,
+    header: bytes,
+    expected: bool,
+) -> None:
+    monkeypatch.setattr(settings.debug, "profile_token", token)
+    monkeypatch.setattr(settings.debug, "profile_sample_rate", 0.0)
+    monkeypatch.setattr(settings.debug, "profile_dir", str(tmp_path))
+
+    middleware = ProfilingMiddleware(app)
+
+    assert middleware.should_profile(scope(header)) is expected
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("enforce", [True, False])
+async def test_query_budget_exceeded(
+    monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture, enforce: bool
+) -> None:
+    monkeypatch.setattr(settings.debug, "enforce_query_budgets", enforce)
+    middleware = QueryStatsMiddleware(over_budget_app)
+    http_scope: Scope = {"type": "http", "method": "GET", "path": "/chat/"}
+    message = "GET /chat/ ran 1 queries, budget is 0"
+
+    if enforce:
+        with pytest.raises(RuntimeError, match=message):
+            await middleware(http_scope, receive, send)
+    else:
+        # Outside tests, going over budget must not fail the request.
+        await middleware(http_scope, receive, send)
+        assert message in caplog.text
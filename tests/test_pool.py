@@ -0,0 +1,59 @@
+import asyncio
+from typing import AsyncGenerator
+
+import pytest
+
+from app import llm, schemas
+from app.db import AsyncSession
+from app.metrics import metrics
+from app.service import AppService
+
+
+@pytest.mark.anyio
+async def test_pool_usage_is_flat(
+    session: AsyncSession, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    started = 0
+    release = asyncio.Event()
+
+    async def stream_completion(
+        messages: list[dict], model: str | None = None
+    ) -> AsyncGenerator[str, None]:
+        nonlocal started
+        started += 1
+        await release.wait()
+        yield "Hello"
+
+    monkeypatch.setattr(llm, "stream_completion", stream_completion)
+
+    app_service = AppService(session)
+    user = await app_service.create_user(
+        schemas.Signup(username="alice", password="password")
+    )
+    created = await app_service.create_chat(user, schemas.CreateChat(message="Hi"))
+    # Like the route, load the chat, then release the request's connection.
+    chat = await app_service.get_chat_by_id(created.id, user)
+    assert chat is not None
+    await session.close()
+
+    async def checked_out_while_streaming(streams: int) -> float:
+        nonlocal started
+        started = 0
+        release.clear()
+
+        async def consume() -> None:
+            async for _ in app_service.generate(chat):
+                pass
+
+        tasks = [asyncio.create_task(consume()) for _ in range(streams)]
+        while started < streams:
+            await asyncio.sleep(0.01)
+        checked_out = metrics.gauges["db_pool_checked_out"]
+
+        release.set()
+        await asyncio.gather(*tasks)
+        return checked_out
+
+    # No connection is held while waiting on the LLM, however many streams.
+    assert await checked_out_while_streaming(1) == 0
+    assert await checked_out_while_streaming(10) == 0
@@ -0,0 +1,67 @@
+from typing import Callable
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.cache import ChatCache
+from app.db import QueryStats
+from app.service import AppService
+
+# The budgets declared on the routes, checked by the query stats middleware.
+ROUTES = [
+    ("GET", "/chat/", None, 2),
+    ("GET", "/chat/export", None, 2),
+    ("GET", "/chat/1", None, 4),
+    ("POST", "/chat/", {"message": "Hi"}, 3),
+    ("DELETE", "/chat/", {"all": True}, 2),
+    ("DELETE", "/chat/1", None, 2),
+    ("POST", "/chat/1/add-message", {"message": "Hi"}, 4),
+    ("GET", "/chat/generate/1", None, 4),
+]
+
+
+@pytest.mark.parametrize(("method", "path", "body", "budget"), ROUTES)
+@pytest.mark.parametrize("cache_size", [0, 1024])
+@pytest.mark.usefixtures("fake_llm")
+def test_query_budget(
+    query_stats: list[QueryStats],
+    client: TestClient,
+    login: Callable[[str], None],
+    monkeypatch: pytest.MonkeyPatch,
+    method: str,
+    path: str,
+    body: dict | None,
+    budget: int,
+    cache_size: int,
+) -> None:
+    login("alice")
+    client.post("/chat/", json={"message": "Hello"})
+    client.post("/chat/1/add-message", json={"message": "Again"})
+    # Budgets must hold when the chat has to be loaded from the database, with
+    # a cold cache or without one, as with PostgreSQL by default.
+    cache = ChatCache(max_entries=cache_size, max_bytes=1024 * 1024)
+    monkeypatch.setattr(AppService, "chat_cache", cache)
+
+    # A route over its budget raises, which the client re-raises here.
+    response = client.request(method, path, json=body)
+
+    assert response.status_code == 200
+    assert query_stats[-1].budget == budget
+    assert query_stats[-1].queries <= budget
+
+
+@pytest.mark.parametrize("path", ["/chat/export", "/chat/generate/1"])
+@pytest.mark.usefixtures("fake_llm")
+def test_streamed_queries_count(
+    query_stats: list[QueryStats],
+    client: TestClient,
+    login: Callable[[str], None],
+    path: str,
+) -> None:
+    login("alice")
+    client.post("/chat/", json={"message": "Hello"})
+
+    response = client.get(path)
+
+    # The headers only count the queries run before the body is streamed.
+    assert query_stats[-1].queries > int(response.headers["X-DB-Queries"])
@@ -0,0 +1,49 @@
+from typing import Iterator
+
+import pytest
+
+from app.rendering import MarkdownRenderer
+
+pytestmark = pytest.mark.usefixtures("fresh_metrics")
+
+MESSAGE = "# Title\n\n" + "Some *markdown*. " * 10
+
+
+@pytest.fixture
+def renderer() -> Iterator[MarkdownRenderer]:
+    renderer = MarkdownRenderer(
+        inline_max_size=10,
+        max_size=len(MESSAGE),
+        timeout=30.0,
+        workers=1,
+        cache_max_bytes=1024 * 1024,
+    )
+    yield renderer
+    renderer.close()
+
+
+@pytest.mark.anyio
+async def test_timed_out_render_is_not_cached(renderer: MarkdownRenderer) -> None:
+    # Starting a worker process takes far longer than this.
+    renderer.timeout = 0.000001
+    assert (await renderer.render(MESSAGE)).startswith("<pre><code>")
+    assert renderer.render_now(MESSAGE).startswith("<pre><code>")
+
+    renderer.timeout = 30.0
+    rendered = await renderer.render(MESSAGE)
+
+    assert rendered.startswith("<h1>Title</h1>")
+    assert renderer.render_now(MESSAGE) == rendered
+
+
+@pytest.mark.anyio
+async def test_too_large_message_falls_back_to_plaintext(
+    renderer: MarkdownRenderer,
+) -> None:
+    text = MESSAGE + "<script>"
+
+    rendered = await renderer.render(text)
+
+    assert rendered.startswith("<pre><code>")
+    assert "&lt;script&gt;" in rendered
+    assert renderer.render_now(text) == rendered
@@ -0,0 +1,179 @@
+from typing import AsyncGenerator, Callable
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from app.metrics import metrics
+from app.scheduler import GenerationScheduler, Ticket, scheduler
+
+pytestmark = pytest.mark.usefixtures("fresh_metrics")
+
+
+def make_scheduler(
+    max_concurrency: int = 1,
+    max_per_user: int = 1,
+    rate: float = 100.0,
+    burst: int = 100,
+    max_queue: int = 10,
+) -> GenerationScheduler:
+    return GenerationScheduler(
+        max_concurrency=max_concurrency,
+        max_per_user=max_per_user,
+        rate=rate,
+        burst=burst,
+        max_queue=max_queue,
+    )
+
+
+async def enqueue(
+    scheduler: GenerationScheduler, user_id: int
+) -> tuple[Ticket, AsyncGenerator[int, None]]:
+    """
+    Get a ticket and start waiting on it, returning the ticket and its queue
+    positions. The ticket is admitted as soon as a slot is free.
+    """
+    ticket = scheduler.ticket(user_id)
+    positions = ticket.wait()
+    await anext(positions, None)
+    return ticket, positions
+
+
+@pytest.mark.anyio
+async def test_per_user_limit() -> None:
+    scheduler = make_scheduler(max_concurrency=10, max_per_user=1)
+
+    first, _ = await enqueue(scheduler, user_id=1)
+    second, _ = await enqueue(scheduler, user_id=1)
+    other, _ = await enqueue(scheduler, user_id=2)
+
+    assert first.admitted and other.admitted
+    assert not second.admitted
+
+    first.release()
+    assert second.admitted
+    assert scheduler.running_per_user == {1: 1, 2: 1}
+
+
+@pytest.mark.anyio
+async def test_global_limit() -> None:
+    scheduler = make_scheduler(max_concurrency=2, max_per_user=2)
+
+    tickets = [(await enqueue(scheduler, user_id))[0] for user_id in (1, 2, 3)]
+
+    assert [ticket.admitted for ticket in tickets] == [True, True, False]
+    assert scheduler.running == 2
+    assert scheduler.queued == 1
+
+    tickets[0].release()
+    assert tickets[2].admitted
+    assert scheduler.running == 2
+
+
+def test_rate_limit() -> None:
+    scheduler = make_scheduler(rate=0.5, burst=2)
+
+    scheduler.ticket(user_id=1)
+    scheduler.ticket(user_id=1)
+    with pytest.raises(HTTPException) as error:
+        scheduler.ticket(user_id=1)
+
+    assert error.value.status_code == 429
+    assert error.value.headers == {"Retry-After": "2"}
+    assert metrics.counters["generate_rate_limited_total"] == 1
+
+    # Other users have their own bucket.
+    scheduler.ticket(user_id=2)
+
+    # A token is available again once the bucket refilled.
+    scheduler.buckets[1].updated -= 2
+    scheduler.ticket(user_id=1)
+
+
+@pytest.mark.anyio
+async def test_full_queue() -> None:
+    scheduler = make_scheduler(max_queue=1)
+    await enqueue(scheduler, user_id=1)
+    await enqueue(scheduler, user_id=2)
+
+    with pytest.raises(HTTPException) as error:
+        scheduler.ticket(user_id=3)
+
+    assert error.value.status_code == 503
+    assert metrics.counters["generate_queue_rejected_total"] == 1
+
+
+@pytest.mark.anyio
+async def test_round_robin() -> None:
+    scheduler = make_scheduler(max_per_user=10)
+    running, _ = await enqueue(scheduler, user_id=3)
+
+    # A user with many queued tickets does not starve a user queued later.
+    tickets = [(await enqueue(scheduler, user_id=1))[0] for _ in range(3)]
+    tickets.insert(1, (await enqueue(scheduler, user_id=2))[0])
+
+    admitted: list[Ticket] = []
+    for ticket in [running, *tickets]:
+        ticket.release()
+        admitted.extend(t for t in tickets if t.admitted and t not in admitted)
+
+    assert admitted == tickets
+
+
+@pytest.mark.anyio
+async def test_queue_positions() -> None:
+    scheduler = make_scheduler()
+    running, _ = await enqueue(scheduler, user_id=1)
+
+    second = scheduler.ticket(user_id=2)
+    second_positions = second.wait()
+    assert await anext(second_positions) == 1
+
+    third = scheduler.ticket(user_id=3)
+    third_positions = third.wait()
+    assert await anext(third_positions) == 2
+
+    # The position is reported again when it changes.
+    running.release()
+    assert second.admitted
+    assert await anext(third_positions) == 1
+
+    # Waiting stops once the ticket is admitted.
+    second.release()
+    assert third.admitted
+    assert await anext(third_positions, None) is None
+
+
+@pytest.mark.anyio
+async def test_queue_metrics() -> None:
+    scheduler = make_scheduler()
+    running, _ = await enqueue(scheduler, user_id=1)
+    queued, _ = await enqueue(scheduler, user_id=2)
+
+    assert metrics.gauges["generate_running"] == 1
+    assert metrics.gauges["generate_queue_depth"] == 1
+
+    running.release()
+    queued.release()
+
+    assert metrics.gauges["generate_running"] == 0
+    assert metrics.gauges["generate_queue_depth"] == 0
+    assert metrics.summaries["generate_queue_wait_seconds"].count == 2
+
+
+@pytest.mark.usefixtures("fake_llm")
+def test_generate_rate_limited(
+    client: TestClient,
+    login: Callable[[str], None],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(scheduler, "rate", 0.1)
+    monkeypatch.setattr(scheduler, "burst", 1)
+    login("alice")
+    client.post("/chat/", json={"message": "Hello"})
+
+    assert client.get("/chat/generate/1").status_code == 200
+
+    response = client.get("/chat/generate/1")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "10"
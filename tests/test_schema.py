@@ -0,0 +1,93 @@
+import pytest
+from sqlalchemy import (
+    Column,
+    Connection,
+    DateTime,
+    ForeignKey,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    func,
+    inspect,
+)
+
+from app.db import AsyncSession, get_engine, init_models
+from app.db.models import Base
+from app.service import AppService
+
+
+def timestamps() -> list[Column]:
+    return [
+        Column("create_date", DateTime, server_default=func.now(), nullable=False),
+        Column("update_date", DateTime, server_default=func.now(), nullable=False),
+    ]
+
+
+# The schema created by the first release, before soft deletion and archives.
+baseline = MetaData()
+Table(
+    "users",
+    baseline,
+    Column("id", Integer, primary_key=True),
+    Column("username", String, nullable=False, unique=True),
+    Column("hashed_password", String, nullable=False),
+    *timestamps(),
+)
+Table(
+    "chats",
+    baseline,
+    Column("id", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("user_id", ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+    *timestamps(),
+)
+Table(
+    "chat_messages",
+    baseline,
+    Column("id", Integer, primary_key=True),
+    Column("chat_id", ForeignKey("chats.id", ondelete="CASCADE"), nullable=False),
+    Column("kind", String, nullable=False),
+    Column("content", String, nullable=False),
+    *timestamps(),
+)
+
+
+def create_baseline(conn: Connection) -> None:
+    Base.metadata.drop_all(conn)
+    baseline.create_all(conn)
+    tables = baseline.tables
+    conn.execute(tables["users"].insert(), {"username": "alice", "hashed_password": ""})
+    conn.execute(tables["chats"].insert(), {"name": "Chat", "user_id": 1})
+    conn.execute(
+        tables["chat_messages"].insert(),
+        {"chat_id": 1, "kind": "human", "content": "Hello"},
+    )
+
+
+def schema(conn: Connection) -> tuple[set[str], set[str | None]]:
+    inspector = inspect(conn)
+    columns = {column["name"] for column in inspector.get_columns("chats")}
+    indexes = {index["name"] for index in inspector.get_indexes("chat_messages")}
+    return columns, indexes
+
+
+@pytest.mark.anyio
+async def test_init_models_upgrades_existing_database(session: AsyncSession) -> None:
+    async with get_engine().begin() as conn:
+        await conn.run_sync(create_baseline)
+
+    await init_models()
+    # Upgrading is idempotent.
+    await init_models()
+
+    async with get_engine().connect() as conn:
+        columns, indexes = await conn.run_sync(schema)
+    assert "deleted_at" in columns
+    assert "ix_chat_messages_chat_id_create_date" in indexes
+
+    app_service = AppService(session)
+    user = await app_service.get_user_by_id(1)
+    assert user is not None
+    chats = await app_service.get_all_chats(user)
+    assert [chat.name for chat in chats] == ["Chat"]
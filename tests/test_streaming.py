@@ -0,0 +1,106 @@
+import asyncio
+from typing import AsyncGenerator, Literal
+
+import pytest
+
+from app.metrics import metrics
+from app.scheduler import GenerationScheduler, Ticket
+from app.streaming import buffered, detached_producers
+
+pytestmark = [pytest.mark.anyio, pytest.mark.usefixtures("fresh_metrics")]
+
+
+async def admitted_ticket(scheduler: GenerationScheduler) -> Ticket:
+    ticket = scheduler.ticket(user_id=1)
+    async for _ in ticket.wait():
+        pass
+    return ticket
+
+
+def make_scheduler() -> GenerationScheduler:
+    return GenerationScheduler(
+        max_concurrency=1, max_per_user=1, rate=100.0, burst=100, max_queue=10
+    )
+
+
+async def test_slow_reader_gets_bounded_frames() -> None:
+    async def frames() -> AsyncGenerator[dict, None]:
+        for index in range(100):
+            yield {"data": index}
+            await asyncio.sleep(0)
+
+    received = []
+    async for frame in buffered(frames(), maxsize=4, on_disconnect="cancel"):
+        received.append(frame["data"])
+        await asyncio.sleep(0.01)
+
+    # Older frames were dropped, but the final frame always gets through.
+    assert len(received) < 100
+    assert received[-1] == 99
+    assert received == sorted(received)
+    assert metrics.counters["sse_frames_dropped_total"] == 100 - len(received)
+
+
+async def test_producer_error_reaches_reader() -> None:
+    async def frames() -> AsyncGenerator[dict, None]:
+        yield {"data": 0}
+        raise RuntimeError("upstream failed")
+
+    with pytest.raises(RuntimeError, match="upstream failed"):
+        async for _ in buffered(frames(), maxsize=4, on_disconnect="cancel"):
+            pass
+
+
+@pytest.mark.parametrize("on_disconnect", ["cancel", "detach"])
+async def test_disconnect(on_disconnect: Literal["cancel", "detach"]) -> None:
+    scheduler = make_scheduler()
+    ticket = await admitted_ticket(scheduler)
+    release = asyncio.Event()
+    finished = False
+
+    async def frames() -> AsyncGenerator[dict, None]:
+        nonlocal finished
+        yield {"data": "first"}
+        await release.wait()
+        yield {"data": "last"}
+        finished = True
+
+    stream = buffered(
+        frames(), maxsize=4, on_disconnect=on_disconnect, on_done=ticket.release
+    )
+    assert (await anext(stream))["data"] == "first"
+
+    # The client goes away while the producer waits on the upstream.
+    await stream.aclose()
+    await asyncio.sleep(0)
+
+    if on_disconnect == "cancel":
+        assert metrics.counters["sse_cancelled_total"] == 1
+        assert not detached_producers
+    else:
+        assert metrics.counters["sse_detached_total"] == 1
+        assert len(detached_producers) == 1
+        # The generation slot is held until the producer completes.
+        assert scheduler.running == 1
+
+        release.set()
+        while detached_producers:
+            await asyncio.sleep(0)
+
+    assert finished == (on_disconnect == "detach")
+    assert ticket.released
+    assert scheduler.running == 0
+
+
+async def test_disconnect_while_queued() -> None:
+    scheduler = make_scheduler()
+    running = await admitted_ticket(scheduler)
+    queued = scheduler.ticket(user_id=2)
+
+    positions = queued.wait()
+    assert await anext(positions) == 1
+    await positions.aclose()
+
+    assert scheduler.queued == 0
+    running.release()
+    assert scheduler.running == 0